@@ -30,7 +30,7 @@ def end_ballot_distribution_phase(election, **kwargs):
         # successfully notified.
         api_session_classes = [VoteCollectorAPISession, BulletinBoardAPISession]
         for api_session_class in reversed(api_session_classes):
-            with api_session_class() as s:
+            with api_session_class.borrow() as s:
                 serializer = ElectionSerializer(instance=election, fields=['state'])
                 r = s.patch('elections/%s/' % election.slug, json=serializer.data)
                 r.raise_for_status()
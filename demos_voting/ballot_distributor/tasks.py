@@ -18,7 +18,7 @@ from six.moves import zip
 from demos_voting.ballot_distributor.models import Election, BallotArchive, VoterList, Ballot, Voter
 from demos_voting.ballot_distributor.serializers import VoterSerializer
 from demos_voting.ballot_distributor.utils.api import BulletinBoardAPISession
-from demos_voting.base.utils import get_range_in_chunks
+from demos_voting.base.utils import get_key_range_in_chunks, get_range_in_chunks
 
 TASK_CONCURRENCY = getattr(settings, 'DEMOS_VOTING_TASK_CONCURRENCY', None) or multiprocessing.cpu_count()
 
@@ -141,25 +141,31 @@ def process_ballot_archive(ballot_archive_pk):
         # nested query instead.
         Ballot.objects.filter(pk__in=ballots).update(archive=ballot_archive)
     # Start the ballot paper generation tasks.
+    ballots = ballot_archive.ballots.all()
+    serial_number_ranges = get_key_range_in_chunks(ballots, TASK_CONCURRENCY, 'serial_number')
     generate_ballot_archive_files_tasks = [
-        generate_ballot_archive_files.si(ballot_archive_pk, range_start, range_stop)
-        for range_start, range_stop in get_range_in_chunks(ballot_archive.ballot_count, TASK_CONCURRENCY)
+        generate_ballot_archive_files.si(ballot_archive_pk, serial_number_start, serial_number_stop)
+        for serial_number_start, serial_number_stop in serial_number_ranges
     ]
     finalize_ballot_archive_task = finalize_ballot_archive.si(ballot_archive_pk=ballot_archive_pk)
     chord(generate_ballot_archive_files_tasks, finalize_ballot_archive_task).delay()
 
 
 @shared_task
-def generate_ballot_archive_files(ballot_archive_pk, range_start, range_stop):
+def generate_ballot_archive_files(ballot_archive_pk, serial_number_start, serial_number_stop):
     """
-    Generate the specified ballots' papers.
+    Generate the papers of the ballots in the specified serial number range
+    (stop is exclusive).
     """
     ballot_archive = BallotArchive.objects.prefetch_related('election__questions__options').get(pk=ballot_archive_pk)
     if ballot_archive.state in (ballot_archive.STATE_FAILED, ballot_archive.STATE_CANCELLED):
         return
     assert ballot_archive.state == ballot_archive.STATE_PROCESSING
     # Generate the ballot papers' files.
-    ballots = ballot_archive.ballots.all()[range_start: range_stop]
+    ballots = ballot_archive.ballots.filter(
+        serial_number__gte=serial_number_start,
+        serial_number__lt=serial_number_stop,
+    )
     for ballot in ballots.iterator():
         prefetch_related_objects([ballot], 'parts__questions__options')
         ballot.election = ballot_archive.election  # force-"prefetch" the election
@@ -294,7 +300,7 @@ def send_voter_list_mails(voter_list_pk, range_start, range_stop):
         # However the ballot and voter querysets would not be possible to be
         # used there because they would be re-evaluated and the former would
         # be empty and the latter would select new random ballots.
-        with mail.get_connection() as connection, BulletinBoardAPISession() as s:
+        with mail.get_connection() as connection, BulletinBoardAPISession.borrow() as s:
             # The ballot and the voter querysets may contain many objects and
             # are only evaluated at this point (without caching their results).
             for ballot, voter in zip(ballots.iterator(), voters.iterator()):
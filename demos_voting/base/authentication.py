@@ -8,15 +8,22 @@ import re
 
 import pytz
 
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
 from django.utils import timezone
 from django.utils.crypto import constant_time_compare
-from django.utils.encoding import force_bytes
+from django.utils.encoding import force_bytes, force_text
 from django.utils.http import parse_http_date_safe
 
 from rest_framework.authentication import BaseAuthentication, get_authorization_header
 from rest_framework.exceptions import AuthenticationFailed
 
 from demos_voting.base.models import HTTPSignatureKey, HTTPSignatureNonce
+from demos_voting.base.utils.http_signatures import get_key, get_nonce_store
+
+# The WSGI environ key (also a `request.META` key) of the body's expected
+# digest, if the body is verified while it is being read.
+DIGEST_ENVIRON_KEY = 'demos_voting.digest'
 
 
 class HTTPSignatureAuthentication(BaseAuthentication):
@@ -80,8 +87,14 @@ class HTTPSignatureAuthentication(BaseAuthentication):
         date = datetime.datetime.utcfromtimestamp(date_timestamp).replace(tzinfo=pytz.utc)
         if date < now - HTTPSignatureNonce.MAX_CLOCK_SKEW or date > now + HTTPSignatureNonce.MAX_CLOCK_SKEW:
             raise AuthenticationFailed
-        # Validate the `digest` header.
-        if request.body:
+        # Validate the `digest` header. If the body is verified while it is
+        # being read (see `DigestVerifyingWSGIMiddleware`) then it does not
+        # have to be read into memory here.
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        if content_length > 0:
             digest_header = request.META.get('HTTP_DIGEST')
             if not digest_header:
                 raise AuthenticationFailed
@@ -91,21 +104,21 @@ class HTTPSignatureAuthentication(BaseAuthentication):
             for i in range(1, match.lastindex + 1, 2):
                 algorithm = match.group(i)
                 digest = match.group(i + 1)
-                if algorithm == 'SHA-256':
-                    digest2 = base64.b64encode(hashlib.sha256(force_bytes(request.body)).digest())
-                else:  # Currently only `SHA-256` is supported.
+                if algorithm != 'SHA-256':  # Currently only `SHA-256` is supported.
                     raise AuthenticationFailed
-                if digest != digest2:
+            if request.META.get(DIGEST_ENVIRON_KEY) != digest:
+                digest2 = base64.b64encode(hashlib.sha256(force_bytes(request.body)).digest())
+                if not constant_time_compare(digest, force_text(digest2)):
                     raise AuthenticationFailed
         # Validate the `headers` parameter.
         headers2 = list(self.generic_headers)
-        if request.body:
+        if content_length > 0:
             headers2.extend(self.body_headers)
         if set(headers2) - set(auth_params['headers']):
             raise AuthenticationFailed
         # Get the user's key.
         try:
-            key_obj = HTTPSignatureKey.objects.prefetch_related('user').get(key_id=auth_params['key_id'])
+            key_obj = get_key(auth_params['key_id'])
         except HTTPSignatureKey.DoesNotExist:
             raise AuthenticationFailed
         # Validate the `signature` parameter.
@@ -130,17 +143,80 @@ class HTTPSignatureAuthentication(BaseAuthentication):
         if not constant_time_compare(auth_params['signature'], signature2):
             raise AuthenticationFailed
         # Validate the `nonce` parameter.
-        nonce_obj, created = HTTPSignatureNonce.objects.get_or_create(
-            key=key_obj,
-            client_id=auth_params['client_id'],
-            nonce=auth_params['nonce'],
-            date__gte=now - HTTPSignatureNonce.MAX_CLOCK_SKEW,
-            date__lte=now + HTTPSignatureNonce.MAX_CLOCK_SKEW,
-            defaults={'date': date},
-        )
+        created = get_nonce_store().add(key_obj, auth_params['client_id'], auth_params['nonce'], date)
         if not created:
             raise AuthenticationFailed
         return key_obj.user, None
 
     def authenticate_header(self, request):
         return 'Signature realm="api"'
+
+
+class DigestVerifyingWSGIMiddleware(object):
+    """
+    WSGI middleware that verifies the `digest` header of the requests (if any)
+    while their body is being read (e.g. parsed), instead of reading the body
+    into memory first. The digest header itself is validated (and signed) by
+    `HTTPSignatureAuthentication`.
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    def __call__(self, environ, start_response):
+        try:
+            content_length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        match = HTTPSignatureAuthentication.digest_header_re.search(environ.get('HTTP_DIGEST', ''))
+        if content_length > 0 and match:
+            algorithms = match.groups()[0::2]
+            digest = match.group(match.lastindex)  # the same as in `HTTPSignatureAuthentication`
+            if all(algorithm == 'SHA-256' for algorithm in algorithms if algorithm is not None):
+                environ['wsgi.input'] = DigestVerifyingStream(environ['wsgi.input'], content_length, digest)
+                environ[DIGEST_ENVIRON_KEY] = digest
+        return self.application(environ, start_response)
+
+
+class DigestVerifyingStream(object):
+    """
+    Wrap a request's body stream and hash the body while it is being read.
+    `AuthenticationFailed` is raised when the end of the body is reached, if
+    the body's SHA-256 digest (base64-encoded) is not the expected one. Like
+    `HttpRequest.body`, `RequestDataTooBig` is raised when the body is read,
+    if its length exceeds `DATA_UPLOAD_MAX_MEMORY_SIZE`.
+    """
+
+    def __init__(self, stream, content_length, digest):
+        self._stream = stream
+        self._remaining = content_length
+        self._digest = digest
+        self._sha256 = hashlib.sha256()
+        max_size = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        self._too_big = max_size is not None and content_length > max_size
+
+    def _check_size(self):
+        # The exception is raised while reading (not by the WSGI middleware),
+        # so that Django's request handler turns it into a 400 response.
+        if self._too_big:
+            raise RequestDataTooBig("Request body exceeded settings.DATA_UPLOAD_MAX_MEMORY_SIZE.")
+
+    def _update(self, data):
+        if self._remaining <= 0:
+            return data
+        self._sha256.update(data)
+        self._remaining -= len(data)
+        if not data or self._remaining <= 0:
+            self._remaining = 0
+            digest2 = force_text(base64.b64encode(self._sha256.digest()))
+            if not data or not constant_time_compare(self._digest, digest2):
+                raise AuthenticationFailed
+        return data
+
+    def read(self, *args, **kwargs):
+        self._check_size()
+        return self._update(self._stream.read(*args, **kwargs))
+
+    def readline(self, *args, **kwargs):
+        self._check_size()
+        return self._update(self._stream.readline(*args, **kwargs))
@@ -1,60 +1,76 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-import json
-
 from django import forms
 from django.core import exceptions
 from django.core.exceptions import ValidationError
 from django.core.files.base import ContentFile
 from django.core.validators import validate_email
 from django.db import models
+from django.db.models.query_utils import DeferredAttribute
 from django.utils.translation import ugettext_lazy as _, ungettext_lazy
 
 from rest_framework import serializers
 
+from demos_voting.base.utils import packing
+from demos_voting.base.utils.json_codec import CANONICAL_DUMPS_KWARGS, JSONCodec, RawJSON
+
 
 # Model fields ################################################################
 
 class JSONField(models.TextField):
+    """
+    A text field that stores a JSON-encoded value. In lazy mode the value is
+    loaded from the database as `RawJSON` text and it is decoded only the
+    first time that the model attribute is accessed. Note that `values()` and
+    `values_list()` return the `RawJSON` text in lazy mode.
+    """
+
     description = "JSONField"
 
-    default_dumps_kwargs = {
-        'indent': None,
-        'separators': (',', ':'),
-        'sort_keys': True,
-    }
+    default_dumps_kwargs = CANONICAL_DUMPS_KWARGS
     default_loads_kwargs = {}
 
     def __init__(self, *args, **kwargs):
         self.dumps_kwargs = kwargs.pop('dumps_kwargs', {})
         self.loads_kwargs = kwargs.pop('loads_kwargs', {})
+        self.lazy = kwargs.pop('lazy', False)
         super(JSONField, self).__init__(*args, **kwargs)
+        dumps_kwargs = self.default_dumps_kwargs.copy()
+        dumps_kwargs.update(self.dumps_kwargs)
+        loads_kwargs = self.default_loads_kwargs.copy()
+        loads_kwargs.update(self.loads_kwargs)
+        self.codec = JSONCodec(dumps_kwargs, loads_kwargs)
 
     def deconstruct(self):
         name, path, args, kwargs = super(JSONField, self).deconstruct()
         kwargs['dumps_kwargs'] = self.dumps_kwargs
         kwargs['loads_kwargs'] = self.loads_kwargs
+        if self.lazy:
+            kwargs['lazy'] = True
         return name, path, args, kwargs
 
+    def contribute_to_class(self, cls, name, *args, **kwargs):
+        super(JSONField, self).contribute_to_class(cls, name, *args, **kwargs)
+        if self.lazy:
+            setattr(cls, self.attname, LazyJSONAttribute(self, cls))
+
     def _json_dumps(self, value):
-        dumps_kwargs = self.default_dumps_kwargs.copy()
-        dumps_kwargs.update(self.dumps_kwargs)
         try:
-            return json.dumps(value, **dumps_kwargs)
+            return self.codec.dumps(value)
         except Exception as e:
             raise exceptions.ValidationError(e, code='invalid')
 
     def _json_loads(self, value):
-        loads_kwargs = self.default_loads_kwargs.copy()
-        loads_kwargs.update(self.loads_kwargs)
         try:
-            return json.loads(value, **loads_kwargs)
+            return self.codec.loads(value)
         except Exception as e:
             raise exceptions.ValidationError(e, code='invalid')
 
     def from_db_value(self, value, expression, connection, context):
         if value is None:
             return value
+        if self.lazy:
+            return RawJSON(value)
         return self._json_loads(value)
 
     def to_python(self, value):
@@ -65,12 +81,90 @@ class JSONField(models.TextField):
     def get_prep_value(self, value):
         if value is None:
             return value
+        if isinstance(value, RawJSON):
+            return value  # already encoded
         return self._json_dumps(value)
 
     def value_to_string(self, obj):
         return self.get_prep_value(self.value_from_object(obj))
 
 
+class LazyJSONAttribute(DeferredAttribute):
+    """
+    The model attribute of a lazy `JSONField`. The field's `RawJSON` text is
+    decoded the first time that the attribute is accessed.
+    """
+
+    def __init__(self, field, model):
+        super(LazyJSONAttribute, self).__init__(field.attname, model)
+        self.field = field
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super(LazyJSONAttribute, self).__get__(instance, cls)
+        if isinstance(value, RawJSON):
+            value = instance.__dict__[self.field_name] = self.field._json_loads(value)
+        return value
+
+    def __set__(self, instance, value):
+        # A data descriptor, so that `__get__` is called even after the model's
+        # `__init__()` has stored the (raw) value in the instance's `__dict__`.
+        instance.__dict__[self.field_name] = value
+
+
+class PackedBinaryField(models.BinaryField):
+    """
+    A binary field that stores a list of records (e.g. commitments) in the
+    compact format of `demos_voting.base.utils.packing`. The field's Python
+    value is the unpacked list of records.
+    """
+
+    description = "PackedBinaryField"
+
+    def __init__(self, kind, *args, **kwargs):
+        self.kind = kind
+        super(PackedBinaryField, self).__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super(PackedBinaryField, self).deconstruct()
+        kwargs['kind'] = self.kind
+        return name, path, args, kwargs
+
+    def _pack(self, value):
+        try:
+            return packing.pack(self.kind, value)
+        except Exception as e:
+            raise exceptions.ValidationError(e, code='invalid')
+
+    def _unpack(self, value):
+        try:
+            return packing.unpack(self.kind, value)
+        except Exception as e:
+            raise exceptions.ValidationError(e, code='invalid')
+
+    def from_db_value(self, value, expression, connection, context):
+        if value is None:
+            return value
+        return self._unpack(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, list):
+            return value
+        return self._unpack(value)
+
+    def get_prep_value(self, value):
+        if value is None:
+            return value
+        return self._pack(value)
+
+    def value_to_string(self, obj):
+        value = self.value_from_object(obj)
+        if value is None:
+            return value
+        return packing.encode(self.kind, value)
+
+
 # Form fields #################################################################
 
 class MultiEmailField(forms.CharField):
@@ -131,3 +225,55 @@ class ContentFileField(serializers.FileField):
     def to_internal_value(self, data):
         data = ContentFile(data, name=self.field_name)
         return super(ContentFileField, self).to_internal_value(data)
+
+
+class RawJSONField(serializers.JSONField):
+    """
+    A read-only JSON field that outputs the model field's stored JSON text
+    as-is (as `RawJSON`), if the value has not been decoded yet (see the lazy
+    mode of `JSONField`), so that the renderer can copy it to the output
+    verbatim. Otherwise it outputs the decoded value.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs['read_only'] = True
+        super(RawJSONField, self).__init__(*args, **kwargs)
+
+    def get_attribute(self, instance):
+        if len(self.source_attrs) == 1:
+            # Get the value without triggering the lazy decoding.
+            value = instance.__dict__.get(self.source_attrs[0])
+            if isinstance(value, RawJSON):
+                return value
+        return super(RawJSONField, self).get_attribute(instance)
+
+    def to_representation(self, value):
+        return value
+
+
+class PackedField(serializers.Field):
+    """
+    A list of records (e.g. commitments) that is represented in the compact
+    format of `demos_voting.base.utils.packing` (as a base64-encoded string).
+    The list of records itself is also accepted as input.
+    """
+
+    default_error_messages = {
+        'invalid': _("Value must be a list or a packed string."),
+    }
+
+    def __init__(self, kind, *args, **kwargs):
+        self.kind = kind
+        super(PackedField, self).__init__(*args, **kwargs)
+
+    def to_internal_value(self, data):
+        try:
+            if isinstance(data, list):
+                packing.pack(self.kind, data)  # validate the records
+                return data
+            return packing.decode(self.kind, data)
+        except Exception:
+            self.fail('invalid')
+
+    def to_representation(self, value):
+        return packing.encode(self.kind, value)
@@ -1,5 +1,35 @@
+# -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-from django.test import TestCase
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from demos_voting.base.utils.json_codec import CANONICAL_DUMPS_KWARGS, JSONCodec, RawJSON, orjson
+
+
+class JSONCodecTests(SimpleTestCase):
+    value = {
+        'b': [1, -2, 3.5, True, False, None],
+        'a': "Δημος \U0001f5f3 \"quoted\" \\ / \n",
+        'é': {'z': [], 'y': {}},
+    }
+
+    def test_canonical_dumps(self):
+        codec = JSONCodec(CANONICAL_DUMPS_KWARGS)
+        codec.fast_dumps = False  # the standard library
+        text = codec.dumps(self.value)
+        self.assertEqual(text, '{"a":"Δημος \U0001f5f3 \\"quoted\\" \\\\ / \\n",'
+                               '"b":[1,-2,3.5,true,false,null],"é":{"y":{},"z":[]}}')
+        self.assertEqual(codec.loads(text), self.value)
+
+    def test_canonical_dumps_orjson(self):
+        if orjson is None:
+            self.skipTest("orjson is not installed.")
+        codec = JSONCodec(CANONICAL_DUMPS_KWARGS)
+        self.assertTrue(codec.fast_dumps)
+        fallback_codec = JSONCodec(CANONICAL_DUMPS_KWARGS)
+        fallback_codec.fast_dumps = False
+        self.assertEqual(codec.dumps(self.value), fallback_codec.dumps(self.value))
+        self.assertTrue(codec.fast_loads)
+        text = fallback_codec.dumps(self.value)
+        self.assertEqual(codec.loads(text), self.value)
+        self.assertEqual(codec.loads(RawJSON(text)), self.value)
@@ -4,6 +4,9 @@ import hashlib
 
 from django.apps import apps
 from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.db import connections
+from django.db.models import Case, Value, When
+from django.db.models.functions import Cast
 
 from six.moves import range
 
@@ -31,6 +34,51 @@ def get_range_in_chunks(range_length, chunk_count):
     return range_chunks
 
 
+def get_key_range_in_chunks(queryset, chunk_count, key='pk'):
+    """
+    Split the queryset's objects in chunks, like `get_range_in_chunks`, but
+    return the (start, stop) ranges of their integer key (stop is exclusive)
+    instead of the ranges of their positions. The ranges are computed up front
+    with a single query, so that each chunk can be selected with a bounded
+    range filter rather than with OFFSET/LIMIT.
+    """
+    keys = list(queryset.order_by(key).values_list(key, flat=True).distinct())
+    key_range_chunks = []
+    for range_start, range_stop in get_range_in_chunks(len(keys), chunk_count):
+        key_start = keys[range_start]
+        key_stop = keys[range_stop] if range_stop < len(keys) else keys[-1] + 1
+        key_range_chunks.append((key_start, key_stop))
+    return key_range_chunks
+
+
+def bulk_update(objs, field_names, batch_size=None):
+    """
+    Update the specified fields of the model instances with one UPDATE query
+    per batch (similar to Django 2.2's `QuerySet.bulk_update`).
+    """
+    objs = list(objs)
+    if not objs:
+        return
+    model = type(objs[0])
+    fields = [model._meta.get_field(field_name) for field_name in field_names]
+    queryset = model._default_manager.all()
+    requires_cast = (connections[queryset.db].vendor == 'postgresql')
+    batch_size = batch_size or len(objs)
+    for batch_start in range(0, len(objs), batch_size):
+        batch = objs[batch_start: batch_start + batch_size]
+        update_kwargs = {}
+        for field in fields:
+            when_statements = [
+                When(pk=obj.pk, then=Value(getattr(obj, field.attname), output_field=field))
+                for obj in batch
+            ]
+            case_statement = Case(*when_statements, output_field=field)
+            if requires_cast:
+                case_statement = Cast(case_statement, output_field=field)
+            update_kwargs[field.attname] = case_statement
+        queryset.filter(pk__in=[obj.pk for obj in batch]).update(**update_kwargs)
+
+
 class PBKDF2SHA512Hasher(PBKDF2PasswordHasher):
     algorithm = "pbkdf2_sha512"
     iterations = 200000
@@ -2,12 +2,17 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import base64
 import calendar
+import contextlib
 import hashlib
 import hmac
 import os
+import threading
 
 import requests
 
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
 from django.conf import settings
 from django.utils import timezone
 from django.utils.http import http_date
@@ -15,8 +20,8 @@ from django.utils.encoding import force_bytes, force_text
 
 from six.moves.urllib.parse import urljoin, urlparse
 
-from demos_voting.base.models import HTTPSignatureKey, HTTPSignatureNonce
 from demos_voting.base.utils.compat import int_from_bytes
+from demos_voting.base.utils.http_signatures import get_key, get_nonce_store
 
 
 class HTTPSignatureAuth(requests.auth.AuthBase):
@@ -42,7 +47,8 @@ class HTTPSignatureAuth(requests.auth.AuthBase):
         self._server_key_id = server_key_id
 
     def __call__(self, r):
-        key_obj = HTTPSignatureKey.objects.get(key_id=self._server_key_id)
+        key_obj = get_key(self._server_key_id)
+        nonce_store = get_nonce_store()
         # Use the `clientId` parameter to distinguish sent and received nonces.
         client_id = force_text(int_from_bytes(hashlib.sha256(force_bytes(self._client_key_id)).digest()[:16], 'big'))
         # Generate a valid `nonce`-`date` pair.
@@ -50,20 +56,19 @@ class HTTPSignatureAuth(requests.auth.AuthBase):
         while not created:
             nonce = force_text(int_from_bytes(os.urandom(4), 'big'))
             date = timezone.now().replace(microsecond=0)
-            nonce_obj, created = HTTPSignatureNonce.objects.get_or_create(
-                key=key_obj,
-                client_id=client_id,
-                nonce=nonce,
-                date__gte=date - 2 * HTTPSignatureNonce.MAX_CLOCK_SKEW,
-                defaults={'date': date},
-            )
+            created = nonce_store.add(key_obj, client_id, nonce, date)
         # Generate the `host` header.
         r.headers['Host'] = urlparse(r.url).netloc
         # Generate the `date` header.
         r.headers['Date'] = http_date(calendar.timegm(date.utctimetuple()))
-        # Generate the `digest` header.
+        # Generate the `digest` header. A streaming body has already been
+        # hashed while it was being generated.
         if r.body:
-            r.headers['Digest'] = 'SHA-256=' + force_text(base64.b64encode(hashlib.sha256(r.body).digest()))
+            if isinstance(r.body, StreamingBody):
+                digest = r.body.sha256_digest()
+            else:
+                digest = hashlib.sha256(r.body).digest()
+            r.headers['Digest'] = 'SHA-256=' + force_text(base64.b64encode(digest))
         # Generate the `headers` parameter.
         headers = list(self.generic_headers)
         if r.body:
@@ -93,14 +98,111 @@ class HTTPSignatureAuth(requests.auth.AuthBase):
         return r
 
 
+class StreamingBody(object):
+    """
+    A request body that is generated in chunks (e.g. a JSON list or NDJSON).
+    The chunks are hashed as they are written, so that the `digest` header can
+    be generated without joining and hashing the whole body again, and they
+    are sent one by one (with a `content-length` header, not chunked).
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._length = 0
+        self._sha256 = hashlib.sha256()
+        self._index = 0  # the current chunk
+        self._offset = 0  # the offset in the current chunk
+        self._position = 0
+
+    def write(self, chunk):
+        chunk = force_bytes(chunk)
+        self._chunks.append(chunk)
+        self._length += len(chunk)
+        self._sha256.update(chunk)
+
+    def sha256_digest(self):
+        return self._sha256.digest()
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+    def read(self, size=-1):
+        data = []
+        while self._index < len(self._chunks) and size != 0:
+            chunk = self._chunks[self._index]
+            end = len(chunk) if size < 0 else min(len(chunk), self._offset + size)
+            data.append(chunk[self._offset:end])
+            if size > 0:
+                size -= end - self._offset
+            self._position += end - self._offset
+            if end == len(chunk):
+                self._index += 1
+                self._offset = 0
+            else:
+                self._offset = end
+        return b''.join(data)
+
+    def tell(self):
+        return self._position
+
+    def seek(self, position, whence=os.SEEK_SET):
+        # Only used to rewind the body before retrying a request.
+        assert whence == os.SEEK_SET
+        self._index = 0
+        self._offset = 0
+        self._position = 0
+        self.read(position)
+        return self._position
+
+
 class APISession(requests.Session):
     client_username = None
     server_username = None
 
+    # The thread-local session registry, see `borrow()`.
+    _local = threading.local()
+
     def __init__(self, *args, **kwargs):
         super(APISession, self).__init__(*args, **kwargs)
         self.auth = HTTPSignatureAuth(self.client_username, self.server_username)
         self.verify = getattr(settings, 'DEMOS_VOTING_API_VERIFY', True)
+        # Keep the connections alive and retry only the requests that failed
+        # to connect, since they have not reached the server. Any other retry
+        # would re-send the same signed nonce, which the server may have
+        # already used, so the retry would be rejected as a replay.
+        pool_size = getattr(settings, 'DEMOS_VOTING_API_POOL_SIZE', None) or 10
+        max_retries = Retry(
+            total=getattr(settings, 'DEMOS_VOTING_API_RETRIES', 3),
+            read=0,
+            status=0,
+            backoff_factor=0.5,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=max_retries)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    @classmethod
+    @contextlib.contextmanager
+    def borrow(cls):
+        """
+        Borrow this thread's session for the client-server pair, so that the
+        connections are reused across requests. The session is created on
+        first use (again after a fork) and it is not closed on exit. Sessions
+        are not shared between threads.
+        """
+        local = APISession._local
+        pid = os.getpid()
+        if getattr(local, 'pid', None) != pid:
+            local.registry = {}
+            local.pid = pid
+        key = (cls.client_username, cls.server_username)
+        session = local.registry.get(key)
+        if session is None:
+            session = local.registry[key] = cls()
+        yield session
 
     def request(self, method, url, *args, **kwargs):
         assert not url.startswith('/')
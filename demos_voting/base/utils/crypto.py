@@ -0,0 +1,65 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import collections
+import threading
+from base64 import b64decode
+
+from petlib.ec import EcGroup, EcPt
+
+CACHE_SIZE = 32
+
+
+class CryptoContext(object):
+    """
+    The decoded parameters of an election's commitment scheme: the group, its
+    generator and order and, optionally, the commitment key h. `EcGroup`
+    precomputes the generator's multiplication table when it is created.
+    """
+
+    def __init__(self, str_h=None, nid=415):
+        self.nid = nid
+        self.G = EcGroup(nid)
+        self.ec_g = self.G.generator()
+        self.order = self.G.order()
+        self.ec_h = EcPt.from_binary(b64decode(str_h), self.G) if str_h is not None else None
+        self._baby_steps = {}
+
+    def get_baby_steps(self, step_count):
+        """
+        Return a dict that maps the exported points j * g to j, for each j in
+        range(step_count). The tables are cached.
+        """
+        baby_steps = self._baby_steps.get(step_count)
+        if baby_steps is None:
+            baby_steps = {}
+            ec_sum = self.G.infinite()
+            for j in range(step_count):
+                baby_steps[ec_sum.export()] = j
+                ec_sum = ec_sum + self.ec_g
+            self._baby_steps[step_count] = baby_steps
+        return baby_steps
+
+
+_cache = collections.OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_crypto_context(str_h=None, nid=415):
+    """
+    Return the crypto context of the commitment key str_h (or only of the
+    group, if it is None) and the curve nid. The contexts are kept in a
+    process-wide LRU cache. The cache key includes the commitment key itself,
+    so a changed commitment key never returns a stale context.
+    """
+    key = (nid, str_h)
+    with _cache_lock:
+        crypto_context = _cache.pop(key, None)
+        if crypto_context is not None:
+            _cache[key] = crypto_context  # move to the end
+            return crypto_context
+    crypto_context = CryptoContext(str_h, nid)
+    with _cache_lock:
+        _cache[key] = crypto_context
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return crypto_context
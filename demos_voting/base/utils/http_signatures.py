@@ -0,0 +1,126 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from demos_voting.base.models import HTTPSignatureKey, HTTPSignatureNonce
+
+KEY_CACHE_TIMEOUT = getattr(settings, 'DEMOS_VOTING_API_KEY_CACHE_TIMEOUT', 60)  # seconds
+
+DEFAULT_NONCE_STORE = 'demos_voting.base.utils.http_signatures.DatabaseNonceStore'
+
+# A nonce must be remembered for as long as a request with it can be accepted,
+# i.e. for twice the maximum clock skew.
+NONCE_TIMEOUT = 2 * HTTPSignatureNonce.MAX_CLOCK_SKEW
+
+_key_cache = {}
+_key_cache_lock = threading.Lock()
+_nonce_store = None
+_nonce_store_lock = threading.Lock()
+
+
+def get_key(key_id):
+    """
+    Get an `HTTPSignatureKey` object by its key id. Only the key's fields (not
+    its user) are cached, for `KEY_CACHE_TIMEOUT` seconds, and a new object is
+    returned every time, so that the objects are not shared between requests.
+    It raises `HTTPSignatureKey.DoesNotExist` if the key does not exist.
+    """
+    now = time.time()
+    with _key_cache_lock:
+        key_fields, expires_at = _key_cache.get(key_id, (None, 0))
+    if expires_at <= now:
+        key_obj = HTTPSignatureKey.objects.get(key_id=key_id)
+        key_fields = {'id': key_obj.pk, 'key_id': key_obj.key_id, 'key': key_obj.key, 'user_id': key_obj.user_id}
+        with _key_cache_lock:
+            _key_cache[key_id] = (key_fields, now + KEY_CACHE_TIMEOUT)
+        return key_obj
+    return HTTPSignatureKey(**key_fields)
+
+
+def get_nonce_store():
+    """
+    Get the process's nonce store, as configured in the
+    `DEMOS_VOTING_NONCE_STORE` setting.
+    """
+    global _nonce_store
+    with _nonce_store_lock:
+        if _nonce_store is None:
+            config = getattr(settings, 'DEMOS_VOTING_NONCE_STORE', None) or {}
+            nonce_store_class = import_string(config.get('BACKEND', DEFAULT_NONCE_STORE))
+            _nonce_store = nonce_store_class(**config.get('OPTIONS', {}))
+        return _nonce_store
+
+
+# Nonce stores ################################################################
+
+class BaseNonceStore(object):
+    def add(self, key_obj, client_id, nonce, date):
+        """
+        Record the `nonce`-`date` pair of the client. It returns False if the
+        nonce has already been recorded (it is a replay), otherwise True.
+        """
+        raise NotImplementedError
+
+
+class DatabaseNonceStore(BaseNonceStore):
+    """
+    Store the nonces as `HTTPSignatureNonce` objects. The expired nonces are
+    deleted by the `clean_up_expired_http_signature_nonces` periodic task.
+    """
+
+    def add(self, key_obj, client_id, nonce, date):
+        nonce_obj, created = HTTPSignatureNonce.objects.get_or_create(
+            key=key_obj,
+            client_id=client_id,
+            nonce=nonce,
+            date__gte=date - NONCE_TIMEOUT,
+            date__lte=date + NONCE_TIMEOUT,
+            defaults={'date': date},
+        )
+        return created
+
+
+class RedisNonceStore(BaseNonceStore):
+    """
+    Store the nonces in Redis, with `SET NX EX`. The expired nonces are deleted
+    by Redis.
+    """
+
+    def __init__(self, url='redis://', prefix='demos_voting:nonce:'):
+        import redis
+        self.client = redis.StrictRedis.from_url(url)
+        self.prefix = prefix
+
+    def add(self, key_obj, client_id, nonce, date):
+        name = '%s%s:%s:%s' % (self.prefix, key_obj.key_id, client_id, nonce)
+        return bool(self.client.set(name, b'', nx=True, ex=int(NONCE_TIMEOUT.total_seconds())))
+
+
+class LocalNonceStore(BaseNonceStore):
+    """
+    Store the nonces in the process's memory. Suitable only for development and
+    testing, the nonces are not shared between processes.
+    """
+
+    def __init__(self):
+        self.nonces = {}
+        self.lock = threading.Lock()
+        self.add_count = 0
+
+    def add(self, key_obj, client_id, nonce, date):
+        name = (key_obj.key_id, client_id, nonce)
+        now = time.time()
+        with self.lock:
+            expires_at = self.nonces.get(name)
+            if expires_at is not None and expires_at > now:
+                return False
+            self.nonces[name] = now + NONCE_TIMEOUT.total_seconds()
+            # Delete the expired nonces every now and then.
+            self.add_count += 1
+            if self.add_count % 1024 == 0:
+                self.nonces = {k: v for k, v in self.nonces.items() if v > now}
+        return True
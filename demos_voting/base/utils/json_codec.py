@@ -0,0 +1,55 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import json
+
+import six
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The canonical JSON format: no whitespace, sorted keys and non-ASCII
+# characters as they are (the same as orjson's output).
+CANONICAL_DUMPS_KWARGS = {
+    'ensure_ascii': False,
+    'indent': None,
+    'separators': (',', ':'),
+    'sort_keys': True,
+}
+
+
+class RawJSON(six.text_type):
+    """
+    JSON text that has not been decoded yet (e.g. a `JSONField`'s value, as it
+    was loaded from the database).
+    """
+
+
+class JSONCodec(object):
+    """
+    Encode and decode JSON with the specified keyword arguments of the standard
+    library's `json.dumps` and `json.loads`. If orjson is installed then it is
+    used instead for the canonical format and for decoding with the default
+    arguments, and the standard library is used as a fallback.
+    """
+
+    def __init__(self, dumps_kwargs=None, loads_kwargs=None):
+        self.dumps_kwargs = dumps_kwargs or {}
+        self.loads_kwargs = loads_kwargs or {}
+        self.fast_dumps = orjson is not None and self.dumps_kwargs == CANONICAL_DUMPS_KWARGS
+        self.fast_loads = orjson is not None and not self.loads_kwargs
+
+    def dumps(self, value):
+        if self.fast_dumps:
+            try:
+                return orjson.dumps(value, option=orjson.OPT_SORT_KEYS).decode('utf-8')
+            except TypeError:
+                pass  # e.g. non-string keys, use the standard library
+        return json.dumps(value, **self.dumps_kwargs)
+
+    def loads(self, text):
+        if self.fast_loads:
+            # orjson does not accept subclasses of `str`, e.g. `RawJSON`.
+            return orjson.loads(six.text_type(text))
+        return json.loads(text, **self.loads_kwargs)
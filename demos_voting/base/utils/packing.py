@@ -0,0 +1,114 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from base64 import b64decode, b64encode
+
+from django.utils.encoding import force_text
+
+# A compact binary format for the options' commitments and the options' and
+# questions' zero-knowledge proofs ZK1. These values are lists of records,
+# whose fields are base64-encoded EC points and scalars. In the packed format
+# the fields are laid out positionally, as compressed points (33 bytes) and
+# big-endian scalars (32 bytes) of the P-256 curve. Uncompressed points are
+# compressed when packed. The first byte is the format's version.
+
+VERSION = 1
+
+POINT_SIZE = 33
+SCALAR_SIZE = 32
+
+COMMITMENT = 'commitment'
+OPTION_ZK1 = 'option_zk1'
+QUESTION_ZK1 = 'question_zk1'
+
+
+def _points(*keys):
+    return [(key, POINT_SIZE) for key in keys]
+
+
+def _scalars(*keys):
+    return [(key, SCALAR_SIZE) for key in keys]
+
+
+# The (record layout, last record layout) of each kind of value. The last
+# record of an option's ZK1 is the row ZK.
+_layouts = {
+    COMMITMENT: (
+        _points('C1', 'C2'),
+        _points('C1', 'C2'),
+    ),
+    OPTION_ZK1: (
+        _points('T1', 'T2', 'Y1', 'Y2') + _scalars('phi1', 'phi2', 'phi3', 'phi4', 'phi5', 'phi6'),
+        _points('U1', 'U2', 'Z1', 'Z2') + _scalars('phi7', 'phi8', 'phi9', 'phi10', 'phi11', 'phi12'),
+    ),
+    QUESTION_ZK1: (
+        _points('W1', 'W2') + _scalars('phi13', 'phi14'),
+        _points('W1', 'W2') + _scalars('phi13', 'phi14'),
+    ),
+}
+
+
+# Pack ########################################################################
+
+def pack(kind, value):
+    """Pack a list of records of the specified kind."""
+    layout, last_layout = _layouts[kind]
+    chunks = [bytes(bytearray([VERSION]))]
+    for index, record in enumerate(value):
+        record_layout = last_layout if index == len(value) - 1 else layout
+        if not isinstance(record, dict) or set(record) != set(key for key, size in record_layout):
+            raise ValueError("Record %d has invalid fields." % index)
+        for key, size in record_layout:
+            b = b64decode(record[key])
+            if size == POINT_SIZE and len(b) == 2 * POINT_SIZE - 1 and b[:1] == b'\x04':
+                b = _compress_point(b)
+            if len(b) > size or (size == POINT_SIZE and len(b) != size):
+                raise ValueError("Record %d has an invalid '%s' field." % (index, key))
+            chunks.append(b.rjust(size, b'\0'))
+    return b''.join(chunks)
+
+
+def _compress_point(b):
+    # Convert an uncompressed point (0x04 || x || y) to the compressed form
+    # (0x02 or 0x03 depending on the parity of y || x).
+    x, y = b[1: POINT_SIZE], b[POINT_SIZE:]
+    return bytes(bytearray([2 + (bytearray(y[-1:])[0] & 1)])) + x
+
+
+def encode(kind, value):
+    """Pack a list of records of the specified kind and base64-encode it."""
+    return force_text(b64encode(pack(kind, value)))
+
+
+# Unpack ######################################################################
+
+def unpack(kind, data):
+    """Unpack a list of records of the specified kind."""
+    data = bytes(data)
+    if not data or bytearray(data[:1])[0] != VERSION:
+        raise ValueError("Unsupported format version.")
+    layout, last_layout = _layouts[kind]
+    record_size = sum(size for key, size in layout)
+    last_record_size = sum(size for key, size in last_layout)
+    length = len(data) - 1
+    if length == 0:
+        return []
+    if length < last_record_size or (length - last_record_size) % record_size != 0:
+        raise ValueError("Invalid data length.")
+    record_count = (length - last_record_size) // record_size + 1
+    value = []
+    offset = 1
+    for index in range(record_count):
+        record = {}
+        for key, size in (last_layout if index == record_count - 1 else layout):
+            b = data[offset: offset + size]
+            if size == SCALAR_SIZE:
+                b = b.lstrip(b'\0')  # scalars are minimally encoded
+            record[key] = force_text(b64encode(b))
+            offset += size
+        value.append(record)
+    return value
+
+
+def decode(kind, encoded):
+    """Unpack a base64-encoded list of records of the specified kind."""
+    return unpack(kind, b64decode(encoded))
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+import demos_voting.base.fields
+
+
+def pack_ballot_fields(apps, schema_editor):
+    BallotQuestion = apps.get_model('bulletin_board', 'BallotQuestion')
+    for ballot_question in BallotQuestion.objects.only('zk1').iterator():
+        ballot_question.zk1_packed = ballot_question.zk1
+        ballot_question.save(update_fields=['zk1_packed'])
+    BallotOption = apps.get_model('bulletin_board', 'BallotOption')
+    for ballot_option in BallotOption.objects.only('commitment', 'zk1').iterator():
+        ballot_option.commitment_packed = ballot_option.commitment
+        ballot_option.zk1_packed = ballot_option.zk1
+        ballot_option.save(update_fields=['commitment_packed', 'zk1_packed'])
+
+
+def unpack_ballot_fields(apps, schema_editor):
+    BallotQuestion = apps.get_model('bulletin_board', 'BallotQuestion')
+    for ballot_question in BallotQuestion.objects.only('zk1_packed').iterator():
+        ballot_question.zk1 = ballot_question.zk1_packed
+        ballot_question.save(update_fields=['zk1'])
+    BallotOption = apps.get_model('bulletin_board', 'BallotOption')
+    for ballot_option in BallotOption.objects.only('commitment_packed', 'zk1_packed').iterator():
+        ballot_option.commitment = ballot_option.commitment_packed
+        ballot_option.zk1 = ballot_option.zk1_packed
+        ballot_option.save(update_fields=['commitment', 'zk1'])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('bulletin_board', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ballotquestion',
+            name='zk1_packed',
+            field=demos_voting.base.fields.PackedBinaryField(kind='question_zk1', null=True),
+        ),
+        migrations.AddField(
+            model_name='ballotoption',
+            name='commitment_packed',
+            field=demos_voting.base.fields.PackedBinaryField(kind='commitment', null=True),
+        ),
+        migrations.AddField(
+            model_name='ballotoption',
+            name='zk1_packed',
+            field=demos_voting.base.fields.PackedBinaryField(kind='option_zk1', null=True),
+        ),
+        migrations.RunPython(
+            code=pack_ballot_fields,
+            reverse_code=unpack_ballot_fields,
+        ),
+        migrations.RemoveField(
+            model_name='ballotquestion',
+            name='zk1',
+        ),
+        migrations.RemoveField(
+            model_name='ballotoption',
+            name='commitment',
+        ),
+        migrations.RemoveField(
+            model_name='ballotoption',
+            name='zk1',
+        ),
+        migrations.RenameField(
+            model_name='ballotquestion',
+            old_name='zk1_packed',
+            new_name='zk1',
+        ),
+        migrations.RenameField(
+            model_name='ballotoption',
+            old_name='commitment_packed',
+            new_name='commitment',
+        ),
+        migrations.RenameField(
+            model_name='ballotoption',
+            old_name='zk1_packed',
+            new_name='zk1',
+        ),
+        migrations.AlterField(
+            model_name='ballotquestion',
+            name='zk1',
+            field=demos_voting.base.fields.PackedBinaryField(kind='question_zk1', verbose_name='zero-knowledge proof ZK1'),
+        ),
+        migrations.AlterField(
+            model_name='ballotoption',
+            name='commitment',
+            field=demos_voting.base.fields.PackedBinaryField(kind='commitment', verbose_name='commitment'),
+        ),
+        migrations.AlterField(
+            model_name='ballotoption',
+            name='zk1',
+            field=demos_voting.base.fields.PackedBinaryField(kind='option_zk1', verbose_name='zero-knowledge proof ZK1'),
+        ),
+    ]
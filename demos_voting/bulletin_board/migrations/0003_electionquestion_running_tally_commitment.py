@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+import demos_voting.base.fields
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('bulletin_board', '0002_packed_binary_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='electionquestion',
+            name='running_tally_commitment',
+            field=demos_voting.base.fields.JSONField(blank=True, default=None, dumps_kwargs={}, loads_kwargs={}, null=True, verbose_name='running tally commitment'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('bulletin_board', '0003_electionquestion_running_tally_commitment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='election',
+            name='coins_format',
+            field=models.CharField(choices=[('digits', 'Digits'), ('bits', 'Bits')], default='digits', max_length=16, verbose_name='coins format'),
+        ),
+        migrations.AddField(
+            model_name='election',
+            name='coin_vector',
+            field=models.TextField(blank=True, default=None, null=True, verbose_name='coin vector'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def count_ballots(apps, schema_editor):
+    Election = apps.get_model('bulletin_board', 'Election')
+    Trustee = apps.get_model('bulletin_board', 'Trustee')
+    for election in Election.objects.filter(state__in=['tally', 'completed']).iterator():
+        cast_ballots = election.ballots.filter(parts__is_cast=True)
+        election.cast_ballot_count = cast_ballots.count()
+        election.save(update_fields=['cast_ballot_count'])
+        for trustee in Trustee.objects.filter(election=election).iterator():
+            submitted_ballots = cast_ballots.filter(parts__questions__partial_zk2__trustee=trustee).distinct()
+            trustee.submitted_ballot_count = submitted_ballots.count()
+            trustee.save(update_fields=['submitted_ballot_count'])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('bulletin_board', '0004_election_coin_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='election',
+            name='cast_ballot_count',
+            field=models.PositiveIntegerField(blank=True, default=None, null=True, verbose_name='number of cast ballots'),
+        ),
+        migrations.AddField(
+            model_name='trustee',
+            name='submitted_ballot_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='number of submitted ballots'),
+        ),
+        migrations.RunPython(
+            code=count_ballots,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+import demos_voting.base.fields
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('bulletin_board', '0005_submitted_ballot_count'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ballotoption',
+            name='decommitment',
+            field=demos_voting.base.fields.JSONField(blank=True, default=None, dumps_kwargs={}, lazy=True, loads_kwargs={}, null=True, verbose_name='decommitment'),
+        ),
+        migrations.AlterField(
+            model_name='ballotoption',
+            name='zk2',
+            field=demos_voting.base.fields.JSONField(blank=True, default=None, dumps_kwargs={}, lazy=True, loads_kwargs={}, null=True, verbose_name='zero-knowledge proof ZK2'),
+        ),
+        migrations.AlterField(
+            model_name='ballotquestion',
+            name='zk2',
+            field=demos_voting.base.fields.JSONField(blank=True, default=None, dumps_kwargs={}, lazy=True, loads_kwargs={}, null=True, verbose_name='zero-knowledge proof ZK2'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+import demos_voting.bulletin_board.models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('bulletin_board', '0006_lazy_json_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='election',
+            name='ballot_export_file',
+            field=models.FileField(blank=True, null=True, upload_to=demos_voting.bulletin_board.models.election_ballot_export_path, verbose_name='ballot export'),
+        ),
+    ]
@@ -2,26 +2,32 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import base64
 import hashlib
+import itertools
 
 from django.conf import settings
 from django.db import models
-from django.db.models import Exists, OuterRef, Q
+from django.db.models import Count, Max, Min
 from django.urls import reverse
-from django.utils.encoding import force_bytes, force_text
+from django.utils.encoding import force_text
 from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
 
 from six.moves.urllib.parse import urljoin
 
-from demos_voting.base.fields import JSONField
+from demos_voting.base.fields import JSONField, PackedBinaryField
 from demos_voting.base.models import (
     BaseAdministrator, BaseBallot, BaseBallotOption, BaseBallotPart, BaseBallotQuestion, BaseElection,
     BaseElectionOption, BaseElectionQuestion, BaseTrustee, BaseVoter,
 )
+from demos_voting.base.utils import packing
 from demos_voting.bulletin_board.managers import BallotOptionManager, BallotQuestionManager
 from demos_voting.bulletin_board.utils import crypto
 
 
+def election_ballot_export_path(election, filename):
+    return "%s/elections/%s/ballots.ndjson" % (election._meta.app_label, election.slug)
+
+
 class Election(BaseElection):
     STATE_CHOICES = (
         (BaseElection.STATE_SETUP, _("Setup")),
@@ -33,7 +39,28 @@ class Election(BaseElection):
         (BaseElection.STATE_CANCELLED, _("Cancelled")),
     )
 
+    COINS_FORMAT_DIGITS = 'digits'
+    COINS_FORMAT_BITS = 'bits'
+    COINS_FORMAT_CHOICES = (
+        (COINS_FORMAT_DIGITS, _("Digits")),
+        (COINS_FORMAT_BITS, _("Bits")),
+    )
+
     coins = models.TextField(_("coins"), null=True, blank=True, default=None)
+    coins_format = models.CharField(
+        _("coins format"),
+        max_length=16,
+        choices=COINS_FORMAT_CHOICES,
+        default=COINS_FORMAT_DIGITS,
+    )
+    coin_vector = models.TextField(_("coin vector"), null=True, blank=True, default=None)
+    cast_ballot_count = models.PositiveIntegerField(_("number of cast ballots"), null=True, blank=True, default=None)
+    ballot_export_file = models.FileField(
+        _("ballot export"),
+        upload_to=election_ballot_export_path,
+        null=True,
+        blank=True,
+    )
     state = models.CharField(_("state"), max_length=32, choices=STATE_CHOICES, default=BaseElection.STATE_SETUP)
     tally_started_at = models.DateTimeField(_("tally started at"), null=True, blank=True)
     tally_ended_at = models.DateTimeField(_("tally ended at"), null=True, blank=True)
@@ -41,30 +68,110 @@ class Election(BaseElection):
     def get_absolute_url(self):
         return reverse('bulletin-board:election-detail', args=[self.slug])
 
-    def generate_coins(self):
+    def generate_coins(self, coins_format=None):
         """
-        Generate the voters' coins.
+        Generate the voters' coins. The coin vector is packed one bit per
+        ballot (most significant bit first) and base64-encoded. The coins are
+        the hash of the coin vector, either of its digits (one ASCII digit per
+        ballot) or of its packed bits, depending on the coins format.
         """
+        if coins_format is None:
+            coins_format = getattr(settings, 'DEMOS_VOTING_COINS_FORMAT', None) or self.COINS_FORMAT_DIGITS
         # If a ballot's part A is cast then the ballot's coin is 0, if part B
         # is cast then the coin is 1. All unused ballots' coins are 0. The
-        # coins are ordered by their ballots' serial numbers.
-        cast_part_b_qs = BallotPart.objects.filter(ballot=OuterRef('pk'), tag=BallotPart.TAG_B, is_cast=True)
-        coins = self.ballots.annotate(coin=Exists(cast_part_b_qs)).values_list('coin', flat=True)
+        # coins are ordered by their ballots' serial numbers. Only the ballots
+        # whose coin is 1 are fetched.
+        serial_numbers = self.ballots.values_list('serial_number', flat=True)
+        aggregates = serial_numbers.aggregate(Count('serial_number'), Min('serial_number'), Max('serial_number'))
+        ballot_count = aggregates['serial_number__count']
+        serial_number_min = aggregates['serial_number__min']
+        serial_number_max = aggregates['serial_number__max']
+        cast_part_b_serial_numbers = BallotPart.objects.filter(
+            ballot__election=self,
+            tag=BallotPart.TAG_B,
+            is_cast=True,
+        ).values_list('ballot__serial_number', flat=True)
+        if ballot_count and serial_number_max - serial_number_min + 1 == ballot_count:
+            coin_indices = [serial_number - serial_number_min for serial_number in cast_part_b_serial_numbers]
+        else:
+            # The serial numbers are not consecutive.
+            indices = {
+                serial_number: index
+                for index, serial_number in enumerate(serial_numbers.order_by('serial_number').iterator())
+            }
+            coin_indices = [indices[serial_number] for serial_number in cast_part_b_serial_numbers]
+        bits = bytearray((ballot_count + 7) // 8)
+        for index in coin_indices:
+            bits[index >> 3] |= 0x80 >> (index & 7)
         # Sha256-hash and base64-encode the result.
-        h = hashlib.sha256()
-        for coin in coins.iterator():
-            h.update(force_bytes(int(coin)))
-        self.coins = force_text(base64.b64encode(h.digest()))
+        if coins_format == self.COINS_FORMAT_DIGITS:
+            digits = bytearray(b'0') * ballot_count
+            for index in coin_indices:
+                digits[index] = ord('1')
+            data = bytes(digits)
+        elif coins_format == self.COINS_FORMAT_BITS:
+            data = bytes(bits)
+        else:
+            raise ValueError("Unknown coins format '%s'." % coins_format)
+        self.coins = force_text(base64.b64encode(hashlib.sha256(data).digest()))
+        self.coins_format = coins_format
+        self.coin_vector = force_text(base64.b64encode(bytes(bits)))
 
 
 class ElectionQuestion(BaseElectionQuestion):
+    running_tally_commitment = JSONField(_("running tally commitment"), null=True, blank=True, default=None)
     tally_commitment = JSONField(_("tally commitment"), null=True, blank=True, default=None)
     tally_decommitment = JSONField(_("tally decommitment"), null=True, blank=True, default=None)
 
-    def generate_tally_commitment(self):
-        ballot_options = BallotOption.objects.filter(question__in=self.ballot_questions.all(), is_voted=True)
+    def generate_tally_commitment(self, recompute=False, partial_tally_commitments=None):
+        """
+        Generate the tally commitment from the running tally commitment, or
+        recompute it from all voted ballot options. If the partial tally
+        commitments of all ballots are given (see `get_partial_tally_commitment`)
+        then they are combined instead, and the result is verified against the
+        running tally commitment (if any).
+        """
+        if partial_tally_commitments is not None:
+            tally_commitment = crypto.add_com(partial_tally_commitments)
+            if self.running_tally_commitment is not None and tally_commitment != self.running_tally_commitment:
+                raise ValueError("The running tally commitment is not equal to the recomputed one.")
+            self.tally_commitment = tally_commitment
+        elif recompute or self.running_tally_commitment is None:
+            self.tally_commitment = self._compute_tally_commitment()
+        else:
+            self.tally_commitment = self.running_tally_commitment
+
+    def get_partial_tally_commitment(self, serial_number_start, serial_number_stop):
+        """
+        Return the sum of the commitments of the voted ballot options, only for
+        the ballots in the specified serial number range (stop is exclusive).
+        """
+        ballot_questions = self.ballot_questions.filter(
+            part__ballot__serial_number__gte=serial_number_start,
+            part__ballot__serial_number__lt=serial_number_stop,
+        )
+        return self._compute_tally_commitment(ballot_questions)
+
+    def update_running_tally_commitment(self, commitments):
+        """
+        Add the commitments of the newly voted ballot options to the running
+        tally commitment. The ballot options must have already been marked as
+        voted.
+        """
+        if self.running_tally_commitment is None:
+            # Start from all voted ballot options, including any that were
+            # voted before the running tally commitment was kept.
+            self.running_tally_commitment = self._compute_tally_commitment()
+        else:
+            commitments = itertools.chain([self.running_tally_commitment], commitments)
+            self.running_tally_commitment = crypto.add_com(commitments)
+
+    def _compute_tally_commitment(self, ballot_questions=None):
+        if ballot_questions is None:
+            ballot_questions = self.ballot_questions.all()
+        ballot_options = BallotOption.objects.filter(question__in=ballot_questions, is_voted=True)
         tally_commitments = ballot_options.values_list('commitment', flat=True)
-        self.tally_commitment = crypto.add_com(tally_commitments.iterator())
+        return crypto.add_com(tally_commitments.iterator())
 
     def generate_tally_decommitment(self):
         partial_tally_decommitments = self.partial_tally_decommitments.values_list('value', flat=True)
@@ -74,6 +181,14 @@ class ElectionQuestion(BaseElectionQuestion):
     def total_vote_count(self):
         return self.options.aggregate(models.Sum('vote_count'))['vote_count__sum']
 
+    @cached_property
+    def non_blank_options(self):
+        """
+        The question's non-blank options, in order. Uses the prefetched
+        options, if any.
+        """
+        return [option for option in self.options.all() if option.name]
+
     @cached_property
     def _tally_plaintexts(self):
         return crypto.extract(self.election.commitment_key, self.tally_commitment, self.tally_decommitment,
@@ -120,8 +235,8 @@ class BallotPart(BaseBallotPart):
 
 
 class BallotQuestion(BaseBallotQuestion):
-    zk1 = JSONField(_("zero-knowledge proof ZK1"))
-    zk2 = JSONField(_("zero-knowledge proof ZK2"), null=True, blank=True, default=None)
+    zk1 = PackedBinaryField(packing.QUESTION_ZK1, verbose_name=_("zero-knowledge proof ZK1"))
+    zk2 = JSONField(_("zero-knowledge proof ZK2"), null=True, blank=True, default=None, lazy=True)
 
     objects = BallotQuestionManager()
 
@@ -131,6 +246,28 @@ class BallotQuestion(BaseBallotQuestion):
         else:
             self.zk2 = None
 
+    def restore_election_options(self):
+        """
+        Restore the election options of all the question's options. The
+        options' decommitments are verified in a single batch.
+        """
+        ballot_options = self.options.all()
+        if self.part.is_cast:
+            for ballot_option in ballot_options:
+                ballot_option.election_option = None
+        else:
+            commitment = []
+            decommitment = []
+            for ballot_option in ballot_options:
+                commitment.extend(ballot_option.commitment)
+                decommitment.extend(ballot_option.decommitment)
+            plaintexts = crypto.extract_bits(self.election.commitment_key, commitment, decommitment)
+            offset = 0
+            for ballot_option in ballot_options:
+                plaintext_count = len(ballot_option.commitment)
+                ballot_option._restore_election_option(plaintexts[offset: offset + plaintext_count])
+                offset += plaintext_count
+
 
 class BallotOption(BaseBallotOption):
     election_option = models.ForeignKey(
@@ -143,10 +280,10 @@ class BallotOption(BaseBallotOption):
     )
     vote_code = models.TextField(_("vote-code"), null=True, blank=True, default=None)
     vote_code_hash = models.TextField(_("vote-code hash"), null=True, blank=True, default=None)
-    commitment = JSONField(_("commitment"))
-    decommitment = JSONField(_("decommitment"), null=True, blank=True, default=None)
-    zk1 = JSONField(_("zero-knowledge proof ZK1"))
-    zk2 = JSONField(_("zero-knowledge proof ZK2"), null=True, blank=True, default=None)
+    commitment = PackedBinaryField(packing.COMMITMENT, verbose_name=_("commitment"))
+    decommitment = JSONField(_("decommitment"), null=True, blank=True, default=None, lazy=True)
+    zk1 = PackedBinaryField(packing.OPTION_ZK1, verbose_name=_("zero-knowledge proof ZK1"))
+    zk2 = JSONField(_("zero-knowledge proof ZK2"), null=True, blank=True, default=None, lazy=True)
     is_voted = models.BooleanField(_("is voted"), default=False)
 
     objects = BallotOptionManager()
@@ -155,8 +292,9 @@ class BallotOption(BaseBallotOption):
         if self.part.is_cast:
             self.decommitment = None
         else:
-            partial_decommitments = self.partial_decommitments.values_list('value', flat=True)
-            self.decommitment = crypto.add_decom(partial_decommitments.iterator())
+            # The partial decommitments may have been prefetched.
+            partial_decommitments = self.partial_decommitments.all()
+            self.decommitment = crypto.add_decom(d.value for d in partial_decommitments)
 
     def generate_zk2(self):
         if self.part.is_cast:
@@ -168,14 +306,16 @@ class BallotOption(BaseBallotOption):
         if self.part.is_cast:
             self.election_option = None
         else:
-            plaintexts = crypto.extract(self.election.commitment_key, self.commitment, self.decommitment, 1)
-            try:
-                non_blank_index = plaintexts.index(1)
-            except ValueError:
-                self.election_option = None  # blank option
-            else:
-                non_blank_election_options = self.election_question.options.exclude(Q(name__isnull=True) | Q(name=''))
-                self.election_option = non_blank_election_options[non_blank_index]
+            plaintexts = crypto.extract_bits(self.election.commitment_key, self.commitment, self.decommitment)
+            self._restore_election_option(plaintexts)
+
+    def _restore_election_option(self, plaintexts):
+        try:
+            non_blank_index = plaintexts.index(1)
+        except ValueError:
+            self.election_option = None  # blank option
+        else:
+            self.election_option = self.election_question.non_blank_options[non_blank_index]
 
 
 class Administrator(BaseAdministrator):
@@ -183,15 +323,17 @@ class Administrator(BaseAdministrator):
 
 
 class Trustee(BaseTrustee):
+    # The number of cast ballots whose partial decommitments/ZK2 have been
+    # submitted by the trustee. It is updated when the ballots are submitted.
+    submitted_ballot_count = models.PositiveIntegerField(_("number of submitted ballots"), default=0)
+
     @cached_property
     def has_submitted_tally_decommitment(self):
         return self.partial_tally_decommitments.filter(election_question__in=self.election.questions.all()).exists()
 
-    @cached_property
+    @property
     def has_submitted_all_ballots(self):
-        total_ballots = self.election.ballots.filter(parts__is_cast=True).distinct()
-        submitted_ballots = total_ballots.filter(parts__questions__partial_zk2__trustee=self).distinct()
-        return total_ballots.count() == submitted_ballots.count()
+        return self.submitted_ballot_count == self.election.cast_ballot_count
 
     def send_tally_notification_mail(self, connection=None):
         template_prefix = 'bulletin_board/emails/trustee_tally_notification'
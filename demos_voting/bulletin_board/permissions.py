@@ -72,6 +72,13 @@ class CanCreateBallot(BasePermission):
         return election.state == election.STATE_SETUP and request.user.has_perm('base.is_election_authority')
 
 
+class CanUpdateBallots(BasePermission):
+    def has_permission(self, request, view):
+        election = view.election
+        return (election.state == election.STATE_TALLY and
+                request.user.has_perm('bulletin_board.can_tally_election', election))
+
+
 class CanUpdateBallot(BasePermission):
     def has_object_permission(self, request, view, ballot):
         election = view.election
@@ -1,7 +1,15 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import collections
+import re
+import uuid
+
 from rest_framework import renderers
 
+import six
+
+from demos_voting.base.utils.json_codec import RawJSON
+
 
 class JSONEncoder(renderers.JSONRenderer.encoder_class):
     def __init__(self, *args, **kwargs):
@@ -10,8 +18,41 @@ class JSONEncoder(renderers.JSONRenderer.encoder_class):
 
 
 class JSONRenderer(renderers.JSONRenderer):
+    """
+    Any `RawJSON` values (see `RawJSONField`) are copied to the output as-is,
+    without being decoded and re-encoded. They are replaced by placeholder
+    strings before the data are encoded, and the placeholders are replaced by
+    the raw JSON text afterwards.
+    """
+
     encoder_class = JSONEncoder
 
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        raw_values = []
+        # The placeholders contain a random token, so that they cannot match
+        # any other string of the data. The NUL characters are always escaped.
+        token = uuid.uuid4().hex
+        data = _replace_raw_json(data, raw_values, '\0%s:%%d\0' % token)
+        ret = super(JSONRenderer, self).render(data, accepted_media_type, renderer_context)
+        if not raw_values:
+            return ret
+        placeholder_re = re.compile(br'"\\u0000' + token.encode('ascii') + br':(\d+)\\u0000"')
+        return placeholder_re.sub(lambda m: raw_values[int(m.group(1))].encode('utf-8'), ret)
+
+
+def _replace_raw_json(data, raw_values, placeholder_format):
+    # Return a copy of the data with placeholders in place of `RawJSON`s.
+    if isinstance(data, RawJSON):
+        raw_values.append(data)
+        return placeholder_format % (len(raw_values) - 1)
+    elif isinstance(data, dict):
+        return collections.OrderedDict(
+            (key, _replace_raw_json(value, raw_values, placeholder_format)) for key, value in six.iteritems(data)
+        )
+    elif isinstance(data, (list, tuple)):
+        return [_replace_raw_json(value, raw_values, placeholder_format) for value in data]
+    return data
+
 
 class BrowsableAPIRenderer(renderers.BrowsableAPIRenderer):
     template = 'bulletin_board/api.html'
@@ -6,6 +6,7 @@ import re
 
 from django.core.validators import MaxLengthValidator
 from django.db import transaction
+from django.db.models import F
 
 from rest_framework import serializers
 from rest_framework.reverse import reverse
@@ -14,14 +15,14 @@ from rest_framework_nested import serializers as nested_serializers
 
 import six
 
-from demos_voting.base.fields import ContentFileField
+from demos_voting.base.fields import ContentFileField, PackedField, RawJSONField
 from demos_voting.base.serializers import (
     CreateBallotListMixin, CreateBallotMixin, CreateElectionMixin, DynamicFieldsMixin,
 )
-from demos_voting.base.utils import base32, hasher
+from demos_voting.base.utils import base32, hasher, packing
 from demos_voting.bulletin_board.models import (
     Administrator, Ballot, BallotOption, BallotPart, BallotQuestion, Election, ElectionOption, ElectionQuestion,
-    Trustee, Voter,
+    PartialDecommitment, PartialOptionZK2, PartialQuestionZK2, Trustee, Voter,
 )
 from demos_voting.bulletin_board.tasks import generate_election_results
 
@@ -53,7 +54,7 @@ class ElectionQuestionSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ElectionQuestion
-        exclude = ['id', 'election', 'option_table_layout']
+        exclude = ['id', 'election', 'option_table_layout', 'running_tally_commitment']
 
     def to_representation(self, election_question):
         data = super(ElectionQuestionSerializer, self).to_representation(election_question)
@@ -76,7 +77,9 @@ class ElectionSerializer(DynamicFieldsMixin, serializers.HyperlinkedModelSeriali
 
     class Meta:
         model = Election
-        exclude = ['created_at', 'updated_at', 'tally_started_at', 'tally_ended_at', 'certificate_file']
+        exclude = [
+            'created_at', 'updated_at', 'tally_started_at', 'tally_ended_at', 'certificate_file', 'ballot_export_file',
+        ]
         extra_kwargs = {
             'url': {
                 'view_name': 'bulletin-board:api:election-detail',
@@ -95,9 +98,9 @@ class ElectionSerializer(DynamicFieldsMixin, serializers.HyperlinkedModelSeriali
 
 class BallotOptionSerializer(serializers.ModelSerializer):
     commitment = serializers.JSONField()
-    decommitment = serializers.JSONField(allow_null=True)
+    decommitment = RawJSONField(allow_null=True)
     zk1 = serializers.JSONField()
-    zk2 = serializers.JSONField(allow_null=True)
+    zk2 = RawJSONField(allow_null=True)
     original_index = serializers.IntegerField(allow_null=True, source='_election_option_index')
 
     class Meta:
@@ -126,7 +129,7 @@ class BallotQuestionSerializer(serializers.ModelSerializer):
     options = BallotOptionSerializer(many=True, allow_empty=False)
     index = serializers.IntegerField(source='_election_question_index')
     zk1 = serializers.JSONField()
-    zk2 = serializers.JSONField(allow_null=True)
+    zk2 = RawJSONField(allow_null=True)
 
     class Meta:
         model = BallotQuestion
@@ -202,7 +205,7 @@ class CreateElectionQuestionSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ElectionQuestion
-        exclude = ['id', 'election']
+        exclude = ['id', 'election', 'running_tally_commitment']
 
 
 class CreateElectionSerializer(CreateElectionMixin, serializers.ModelSerializer):
@@ -212,12 +215,15 @@ class CreateElectionSerializer(CreateElectionMixin, serializers.ModelSerializer)
 
     class Meta:
         model = Election
-        exclude = ['id', 'state', 'created_at', 'updated_at', 'tally_started_at', 'tally_ended_at', 'coins']
+        exclude = [
+            'id', 'state', 'created_at', 'updated_at', 'tally_started_at', 'tally_ended_at', 'coins', 'coins_format',
+            'coin_vector', 'cast_ballot_count', 'ballot_export_file',
+        ]
 
 
 class CreateBallotOptionSerializer(serializers.ModelSerializer):
-    commitment = serializers.JSONField()
-    zk1 = serializers.JSONField()
+    commitment = PackedField(packing.COMMITMENT)
+    zk1 = PackedField(packing.OPTION_ZK1)
 
     class Meta:
         model = BallotOption
@@ -226,7 +232,7 @@ class CreateBallotOptionSerializer(serializers.ModelSerializer):
 
 class CreateBallotQuestionSerializer(serializers.ModelSerializer):
     options = CreateBallotOptionSerializer(many=True, allow_empty=False)
-    zk1 = serializers.JSONField()
+    zk1 = PackedField(packing.QUESTION_ZK1)
 
     class Meta:
         model = BallotQuestion
@@ -264,7 +270,7 @@ class CreateBallotSerializer(CreateBallotMixin, serializers.ModelSerializer):
 class CreateTrusteeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Trustee
-        exclude = ['id', 'election', 'user']
+        exclude = ['id', 'election', 'user', 'submitted_ballot_count']
 
     def create(self, validated_data):
         validated_data['election_id'] = self.context['election'].pk
@@ -540,6 +546,13 @@ class VotingUpdateBallotSerializer(serializers.ModelSerializer):
                     ballot_option.vote_code = option_data['vote_code']
                     ballot_option.is_voted = True
                     ballot_option.save(update_fields=['vote_code', 'is_voted'])
+            # Add the voted options' commitments to the question's running
+            # tally commitment. The election is locked by the view, so the
+            # ballot updates are serialized.
+            election_question = ballot_question.election_question
+            commitments = [ballot_question.options.all()[index].commitment for index in option_indices]
+            election_question.update_running_tally_commitment(commitments)
+            election_question.save(update_fields=['running_tally_commitment'])
         return ballot
 
 
@@ -587,8 +600,8 @@ class TallyUpdateElectionSerializer(serializers.ModelSerializer):
             e = "You have already submitted the tally decommitment."
             raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: e})
         # Check if this trustee has submitted the decommitments/zk2 for all
-        # cast ballots. Lock the ballots before checking.
-        election.ballots.filter(parts__is_cast=True).select_for_update().exists()
+        # cast ballots. The ballots are updated only while holding the
+        # election's lock, so the trustee's counter is up-to-date.
         if not self.trustee.has_submitted_all_ballots:
             e = "You have not submitted all the ballots yet."
             raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: e})
@@ -659,6 +672,81 @@ class TallyUpdateBallotPartSerializer(serializers.ModelSerializer):
         fields = ['questions']
 
 
+class TallyUpdateBallotListSerializer(serializers.ListSerializer):
+    """
+    Update many ballots at once. Each ballot's data also contains the ballot's
+    serial number. The instance is a queryset of the election's ballots.
+    """
+
+    default_error_messages = {
+        'max_length': "This value's length must be at most %(limit_value)s.",
+        'does_not_exist': "A ballot with this serial number does not exist.",
+        'not_unique': "This ballot has already been given.",
+    }
+
+    max_ballot_count = 1000
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            e = self.error_messages['not_a_list'].format(input_type=type(data).__name__)
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [e]})
+        if not data:
+            e = self.error_messages['empty']
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [e]})
+        limit_value = self.max_ballot_count
+        if len(data) > limit_value:
+            e = self.error_messages['max_length'] % {'limit_value': limit_value}
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [e]})
+        # Fetch all the ballots at once and validate each ballot's data against
+        # its ballot.
+        serial_numbers = [
+            ballot_data.get('serial_number') if isinstance(ballot_data, dict) else None
+            for ballot_data in data
+        ]
+        ballots = self.instance.filter(
+            serial_number__in=[s for s in serial_numbers if isinstance(s, six.integer_types)],
+        )
+        ballots = {ballot.serial_number: ballot for ballot in ballots}
+        validated_data = []
+        errors = []
+        seen_serial_numbers = set()
+        for ballot_data, serial_number in zip(data, serial_numbers):
+            try:
+                ballot = ballots.get(serial_number)
+                if ballot is None:
+                    e = self.error_messages['does_not_exist']
+                    raise serializers.ValidationError({'serial_number': [e]})
+                if serial_number in seen_serial_numbers:
+                    e = self.error_messages['not_unique']
+                    raise serializers.ValidationError({'serial_number': [e]})
+                seen_serial_numbers.add(serial_number)
+                self.child.instance = ballot
+                try:
+                    validated_ballot_data = self.child.run_validation(ballot_data)
+                finally:
+                    self.child.instance = None
+            except serializers.ValidationError as e:
+                errors.append(e.detail)
+            else:
+                validated_data.append((ballot, validated_ballot_data))
+                errors.append({})
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return validated_data
+
+    def update(self, ballots, validated_data):
+        self.child.update_many(validated_data)
+        return [ballot for ballot, ballot_data in validated_data]
+
+    def save(self, **kwargs):
+        # The validated data is a list of (ballot, data) pairs, which is not
+        # supported by `ListSerializer.save()`.
+        assert not kwargs
+        assert hasattr(self, '_errors') and not self.errors
+        self.instance = self.update(self.instance, self.validated_data)
+        return self.instance
+
+
 class TallyUpdateBallotSerializer(serializers.ModelSerializer):
     parts = TallyUpdateBallotPartSerializer(many=True, allow_empty=False)
 
@@ -671,6 +759,7 @@ class TallyUpdateBallotSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ballot
         fields = ['parts']
+        list_serializer_class = TallyUpdateBallotListSerializer
 
     def validate(self, data):
         data = super(TallyUpdateBallotSerializer, self).validate(data)
@@ -774,19 +863,65 @@ class TallyUpdateBallotSerializer(serializers.ModelSerializer):
         return data
 
     def update(self, ballot, validated_data):
-        for ballot_part, part_data in zip(ballot.parts.all(), validated_data['parts']):
-            for ballot_question, question_data in zip(ballot_part.questions.all(), part_data['questions']):
-                if ballot_part.is_cast:
-                    zk2 = question_data['zk2']
-                    self.trustee.partial_question_zk2.filter(ballot_question=ballot_question).delete()
-                    self.trustee.partial_question_zk2.create(ballot_question=ballot_question, value=zk2)
-                for ballot_option, option_data in zip(ballot_question.options.all(), question_data['options']):
-                    if ballot_part.is_cast:
-                        zk2 = option_data['zk2']
-                        self.trustee.partial_option_zk2.filter(ballot_option=ballot_option).delete()
-                        self.trustee.partial_option_zk2.create(ballot_option=ballot_option, value=zk2)
-                    else:
-                        decommitment = option_data['decommitment']
-                        self.trustee.partial_decommitments.filter(ballot_option=ballot_option).delete()
-                        self.trustee.partial_decommitments.create(ballot_option=ballot_option, value=decommitment)
+        self.update_many([(ballot, validated_data)])
         return ballot
+
+    def update_many(self, ballot_data_list):
+        """
+        Save the trustee's partial ZK2 and partial decommitments of a list of
+        (ballot, validated data) pairs. Any previously submitted values of the
+        same ballots are replaced. The values are inserted with one query per
+        model.
+        """
+        partial_question_zk2_list = []
+        partial_option_zk2_list = []
+        partial_decommitments = []
+        for ballot, validated_data in ballot_data_list:
+            for ballot_part, part_data in zip(ballot.parts.all(), validated_data['parts']):
+                for ballot_question, question_data in zip(ballot_part.questions.all(), part_data['questions']):
+                    if ballot_part.is_cast:
+                        partial_question_zk2_list.append(PartialQuestionZK2(
+                            trustee=self.trustee,
+                            ballot_question=ballot_question,
+                            value=question_data['zk2'],
+                        ))
+                    for ballot_option, option_data in zip(ballot_question.options.all(), question_data['options']):
+                        if ballot_part.is_cast:
+                            partial_option_zk2_list.append(PartialOptionZK2(
+                                trustee=self.trustee,
+                                ballot_option=ballot_option,
+                                value=option_data['zk2'],
+                            ))
+                        else:
+                            partial_decommitments.append(PartialDecommitment(
+                                trustee=self.trustee,
+                                ballot_option=ballot_option,
+                                value=option_data['decommitment'],
+                            ))
+        # Count the ballots that are submitted by this trustee for the first
+        # time (all of them are cast ballots).
+        ballot_pks = [ballot.pk for ballot, validated_data in ballot_data_list]
+        resubmitted_ballot_count = Ballot.objects.filter(
+            pk__in=ballot_pks,
+            parts__questions__partial_zk2__trustee=self.trustee,
+        ).distinct().count()
+        new_ballot_count = len(ballot_pks) - resubmitted_ballot_count
+        # The trustees can re-submit a ballot, so delete any previous values
+        # before inserting the new ones (Django 1.11 does not support upserts).
+        self.trustee.partial_question_zk2.filter(
+            ballot_question__in=[p.ballot_question for p in partial_question_zk2_list],
+        ).delete()
+        self.trustee.partial_option_zk2.filter(
+            ballot_option__in=[p.ballot_option for p in partial_option_zk2_list],
+        ).delete()
+        self.trustee.partial_decommitments.filter(
+            ballot_option__in=[p.ballot_option for p in partial_decommitments],
+        ).delete()
+        PartialQuestionZK2.objects.bulk_create(partial_question_zk2_list)
+        PartialOptionZK2.objects.bulk_create(partial_option_zk2_list)
+        PartialDecommitment.objects.bulk_create(partial_decommitments)
+        if new_ballot_count:
+            Trustee.objects.filter(pk=self.trustee.pk).update(
+                submitted_ballot_count=F('submitted_ballot_count') + new_ballot_count,
+            )
+            self.trustee.submitted_ballot_count += new_ballot_count
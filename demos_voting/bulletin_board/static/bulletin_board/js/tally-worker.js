@@ -35,11 +35,14 @@ onmessage = function(event) {
     while (true) {
         ballots = getHttpRequest(ballotsUrl + '&limit=' + limit + '&offset=' + offset)
         var ballotCount = ballots.results.length;
+        var ballotResults = [];
         for (var i = 0; i < ballotCount; i++) {
             ballot = ballots.results[i];
-            processBallot(ballot);
-            postMessage({type: 'progress', value: 1});
+            ballotResults.push(processBallot(ballot));
         }
+        // Submit all the page's ballots with a single request.
+        patchHttpRequest(election.ballots_url + 'bulk/', ballotResults, 204);
+        postMessage({type: 'progress', value: ballotCount});
         offset += ballotCount;
         limit -= ballotCount;
         if (limit == 0) {
@@ -77,13 +80,13 @@ function getHttpRequest(url) {
     return data;
 }
 
-function patchHttpRequest(url, data) {
+function patchHttpRequest(url, data, expectedStatus) {
     var xhr = new XMLHttpRequest();
     xhr.open('PATCH', url, false);  // synchronous request
     xhr.setRequestHeader('Content-Type', 'application/json');
     xhr.setRequestHeader('X-CSRFToken', csrfToken);
     xhr.onload = function () {
-        if (xhr.status != 200) {
+        if (xhr.status != (expectedStatus || 200)) {
             throw new Error(xhr.responseText);
         }
     }
@@ -91,7 +94,7 @@ function patchHttpRequest(url, data) {
 }
 
 function processBallot(ballot) {
-    var ballotResult = {parts: []};
+    var ballotResult = {serial_number: ballot.serial_number, parts: []};
     for (var p = 0; p < ballot.parts.length; p++) {
         var ballotPart = ballot.parts[p];
         var ballotPartResult = {questions: []};
@@ -108,7 +111,7 @@ function processBallot(ballot) {
         }
         ballotResult.parts.push(ballotPartResult);
     }
-    patchHttpRequest(ballot.url, ballotResult);
+    return ballotResult;
 }
 
 function addToTallyDecommitment(ballot, ballotPart, ballotQuestion) {
@@ -1,20 +1,24 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import multiprocessing
+import tempfile
 
 from celery import chord, shared_task
 from celery.signals import task_failure
 
 from django.conf import settings
 from django.core import mail
+from django.core.files import File
 from django.db import transaction
 from django.db.models import prefetch_related_objects
 from django.utils import timezone
 
-from demos_voting.base.utils import get_range_in_chunks
+from demos_voting.base.utils import bulk_update, get_key_range_in_chunks, get_range_in_chunks
 from demos_voting.bulletin_board.models import Election
 
 TASK_CONCURRENCY = getattr(settings, 'DEMOS_VOTING_TASK_CONCURRENCY', None) or multiprocessing.cpu_count()
+VERIFY_TALLY_COMMITMENT = getattr(settings, 'DEMOS_VOTING_VERIFY_TALLY_COMMITMENT', False)
+AUDIT_DATA_BATCH_SIZE = 100  # ballots
 
 
 # Tally phase tasks ###########################################################
@@ -30,13 +34,64 @@ def prepare_tally_phase(election_pk):
             return
         assert election.state == election.STATE_TALLY
         election.tally_started_at = timezone.now()
+        # The voting phase has ended, so the number of cast ballots is final.
+        # Only one of a ballot's parts can be cast.
+        election.cast_ballot_count = election.ballots.filter(parts__is_cast=True).count()
         election.save()
     # Generate the voters' coins.
     election.generate_coins()
-    election.save(update_fields=['coins'])
+    election.save(update_fields=['coins', 'coins_format', 'coin_vector'])
+    # Generate the tally commitment. If it has to be verified, or if a
+    # question does not have a running tally commitment, then the voted
+    # options' commitments are summed in parallel, one chunk of ballots per
+    # task, and the partial sums are combined (and verified) afterwards.
+    has_running_tally_commitments = all(
+        question.running_tally_commitment is not None for question in election.questions.all()
+    )
+    if has_running_tally_commitments and not VERIFY_TALLY_COMMITMENT:
+        generate_tally_commitment.delay(None, election_pk=election_pk)
+    else:
+        generate_partial_tally_commitment_tasks = [
+            generate_partial_tally_commitment.si(election_pk, range_start, range_stop)
+            for range_start, range_stop in get_range_in_chunks(election.ballot_count, TASK_CONCURRENCY)
+        ]
+        generate_tally_commitment_task = generate_tally_commitment.s(election_pk=election_pk)
+        chord(generate_partial_tally_commitment_tasks, generate_tally_commitment_task).delay()
+
+
+@shared_task
+def generate_partial_tally_commitment(election_pk, range_start, range_stop):
+    """
+    Sum the commitments of the voted options of the specified ballots.
+    """
+    election = Election.objects.prefetch_related('questions').get(pk=election_pk)
+    if election.state in (election.STATE_FAILED, election.STATE_CANCELLED):
+        return
+    assert election.state == election.STATE_TALLY
+    return [
+        question.get_partial_tally_commitment(range_start + 100, range_stop + 100)
+        for question in election.questions.all()
+    ]
+
+
+@shared_task(ignore_result=True)
+def generate_tally_commitment(partial_tally_commitments, election_pk):
+    """
+    Generate the tally commitment, combining the partial tally commitments (if
+    any), and notify the trustees to participate.
+    """
+    election = Election.objects.prefetch_related('questions').get(pk=election_pk)
+    if election.state in (election.STATE_FAILED, election.STATE_CANCELLED):
+        return
+    assert election.state == election.STATE_TALLY
     # Generate the tally commitment.
-    for question in election.questions.all():
-        question.generate_tally_commitment()
+    for question_index, question in enumerate(election.questions.all()):
+        if partial_tally_commitments is None:
+            question.generate_tally_commitment()
+        else:
+            question.generate_tally_commitment(partial_tally_commitments=[
+                partial_tally_commitment[question_index] for partial_tally_commitment in partial_tally_commitments
+            ])
         question.save(update_fields=['tally_commitment'])
     # Notify the trustees to participate.
     with mail.get_connection() as connection:
@@ -61,39 +116,63 @@ def generate_election_results(election_pk):
             option.generate_vote_count()
             option.save(update_fields=['vote_count'])
     # Start the tasks to generate the ballot audit data.
-    ballot_count = election.ballots.filter(parts__is_cast=True).distinct().count()
+    ballots = election.ballots.filter(parts__is_cast=True)
+    serial_number_ranges = get_key_range_in_chunks(ballots, TASK_CONCURRENCY, 'serial_number')
     generate_ballot_audit_data_tasks = [
-        generate_ballot_audit_data.si(election_pk, range_start, range_stop)
-        for range_start, range_stop in get_range_in_chunks(ballot_count, TASK_CONCURRENCY)
+        generate_ballot_audit_data.si(election_pk, serial_number_start, serial_number_stop)
+        for serial_number_start, serial_number_stop in serial_number_ranges
     ]
     finalize_tally_phase_task = finalize_tally_phase.si(election_pk=election_pk)
     chord(generate_ballot_audit_data_tasks, finalize_tally_phase_task).delay()
 
 
 @shared_task
-def generate_ballot_audit_data(election_pk, range_start, range_stop):
+def generate_ballot_audit_data(election_pk, serial_number_start, serial_number_stop):
     """
     Combine the partial decommitments of the ballot parts that have not been
-    cast or the ZK2 of the ballot parts that have been cast.
+    cast or the ZK2 of the ballot parts that have been cast, for the ballots in
+    the specified serial number range (stop is exclusive).
     """
-    election = Election.objects.get(pk=election_pk)
+    election = Election.objects.prefetch_related('questions__options').get(pk=election_pk)
     if election.state in (election.STATE_FAILED, election.STATE_CANCELLED):
         return
     assert election.state == election.STATE_TALLY
-    # Generate the specified ballots' audit data.
-    ballots = election.ballots.filter(parts__is_cast=True).distinct()
-    ballots = ballots[range_start: range_stop]
-    for ballot in ballots.iterator():
-        prefetch_related_objects([ballot], 'parts__questions__options')
-        for ballot_part in ballot.parts.all():
-            for ballot_question in ballot_part.questions.all():
-                ballot_question.generate_zk2()
-                ballot_question.save(update_fields=['zk2'])
-                for ballot_option in ballot_question.options.all():
-                    ballot_option.generate_zk2()
-                    ballot_option.generate_decommitment()
-                    ballot_option.restore_election_option()
-                    ballot_option.save(update_fields=['zk2', 'decommitment', 'election_option'])
+    # The election questions are shared by all the batches' ballot questions,
+    # so each one's mapping of non-blank indices to election options is built
+    # once per task.
+    election_questions = {election_question.pk: election_question for election_question in election.questions.all()}
+    # Generate the specified ballots' audit data, in batches of ballots. The
+    # batch's objects (including the partial decommitments) are fetched in a
+    # few queries, the audit data are generated in memory and then they are
+    # written back with one query per model.
+    ballots = election.ballots.filter(
+        serial_number__gte=serial_number_start,
+        serial_number__lt=serial_number_stop,
+        parts__is_cast=True,
+    )
+    ballots = list(ballots.distinct())
+    for batch_start in range(0, len(ballots), AUDIT_DATA_BATCH_SIZE):
+        ballot_batch = ballots[batch_start: batch_start + AUDIT_DATA_BATCH_SIZE]
+        prefetch_related_objects(ballot_batch, 'parts__questions__options__partial_decommitments')
+        ballot_questions = []
+        ballot_options = []
+        for ballot in ballot_batch:
+            ballot.election = election  # force-"prefetch" the election
+            for ballot_part in ballot.parts.all():
+                for ballot_question in ballot_part.questions.all():
+                    # force-"prefetch" the election question
+                    ballot_question.election_question = election_questions[ballot_question.election_question_id]
+                    ballot_question.generate_zk2()
+                    for ballot_option in ballot_question.options.all():
+                        ballot_option.generate_zk2()
+                        ballot_option.generate_decommitment()
+                    # The decommitments of all the question's options are
+                    # verified in a single batch.
+                    ballot_question.restore_election_options()
+                    ballot_questions.append(ballot_question)
+                    ballot_options.extend(ballot_question.options.all())
+        bulk_update(ballot_questions, ['zk2'])
+        bulk_update(ballot_options, ['zk2', 'decommitment', 'election_option'])
 
 
 @shared_task(ignore_result=True)
@@ -109,6 +188,8 @@ def finalize_tally_phase(election_pk):
         election.state = election.STATE_COMPLETED
         election.tally_ended_at = timezone.now()
         election.save()
+    # Pre-generate the ballot export file, the ballots will not change again.
+    generate_ballot_export_file.delay(election_pk)
     # Notify the voters that the results have been released.
     if election.voters.exists():
         with mail.get_connection(fail_silently=True) as connection:
@@ -116,6 +197,24 @@ def finalize_tally_phase(election_pk):
                 voter.send_election_results_mail(connection=connection)
 
 
+@shared_task(ignore_result=True)
+def generate_ballot_export_file(election_pk):
+    """
+    Generate the file of the completed election's ballot export. Until it is
+    available the export is streamed directly from the database.
+    """
+    # Import here to avoid a circular import (the serializers use the tasks).
+    from demos_voting.bulletin_board.utils import export
+    election = Election.objects.get(pk=election_pk)
+    if election.state != election.STATE_COMPLETED:
+        return
+    with tempfile.TemporaryFile() as f:
+        for line in export.iter_ballots(election):
+            f.write(line)
+        election.ballot_export_file.save('ballots.ndjson', File(f), save=False)
+    election.save(update_fields=['ballot_export_file'])
+
+
 # Tally phase task failure handlers ###########################################
 
 @task_failure.connect(sender=prepare_tally_phase)
@@ -123,6 +222,16 @@ def prepare_tally_task_failure(**kwargs):
     tally_task_failure_handler(**kwargs)
 
 
+@task_failure.connect(sender=generate_partial_tally_commitment)
+def generate_partial_tally_commitment_task_failure(**kwargs):
+    tally_task_failure_handler(**kwargs)
+
+
+@task_failure.connect(sender=generate_tally_commitment)
+def generate_tally_commitment_task_failure(**kwargs):
+    tally_task_failure_handler(**kwargs)
+
+
 @task_failure.connect(sender=generate_election_results)
 def generate_election_results_task_failure(**kwargs):
     tally_task_failure_handler(**kwargs)
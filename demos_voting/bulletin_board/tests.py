@@ -1,5 +1,157 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import datetime
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from demos_voting.base.utils.json_codec import RawJSON
+from demos_voting.bulletin_board.models import (
+    Ballot, BallotOption, BallotPart, BallotQuestion, Election, ElectionOption, ElectionQuestion, PartialDecommitment,
+    PartialOptionZK2, PartialQuestionZK2, Trustee,
+)
+
+B64 = 'AAAA'  # a valid base64-encoded string
+
+
+def create_election(state, ballot_count):
+    """
+    Create an election with one question of 2 options (1 of them blank) and
+    its ballots. Part A of each ballot is cast.
+    """
+    now = timezone.now()
+    election = Election.objects.create(
+        slug='election',
+        name="Election",
+        voting_starts_at=now - datetime.timedelta(days=2),
+        voting_ends_at=now - datetime.timedelta(days=1),
+        communication_language='en',
+        ballot_count=ballot_count,
+        commitment_key=B64,
+        state=state,
+        cast_ballot_count=ballot_count,
+    )
+    election_question = ElectionQuestion.objects.create(
+        election=election,
+        index=0,
+        min_selection_count=0,
+        max_selection_count=1,
+    )
+    ElectionOption.objects.create(question=election_question, index=0, name="Option")
+    ElectionOption.objects.create(question=election_question, index=1, name=None)  # blank option
+    for serial_number in range(100, 100 + ballot_count):
+        ballot = Ballot.objects.create(election=election, serial_number=serial_number)
+        for tag, is_cast in ((BallotPart.TAG_A, True), (BallotPart.TAG_B, False)):
+            ballot_part = BallotPart.objects.create(ballot=ballot, tag=tag, credential_hash=B64, is_cast=is_cast)
+            ballot_question = BallotQuestion.objects.create(
+                part=ballot_part,
+                election_question=election_question,
+                zk1=[],
+            )
+            for index in range(2):
+                BallotOption.objects.create(
+                    question=ballot_question,
+                    index=index,
+                    receipt=B64,
+                    commitment=[],
+                    zk1=[],
+                )
+    return election
+
+
+class LazyJSONFieldTests(TestCase):
+    def setUp(self):
+        self.election = create_election(Election.STATE_COMPLETED, 1)
+
+    def test_lazy_decoding(self):
+        ballot_option = BallotOption.objects.filter(question__part__is_cast=False).first()
+        ballot_option.decommitment = [B64, {'a': 1}]
+        ballot_option.save(update_fields=['decommitment'])
+        ballot_option = BallotOption.objects.get(pk=ballot_option.pk)
+        # The value is loaded as JSON text and decoded on first access.
+        self.assertIsInstance(ballot_option.__dict__['decommitment'], RawJSON)
+        self.assertEqual(ballot_option.decommitment, [B64, {'a': 1}])
+        self.assertEqual(ballot_option.__dict__['decommitment'], [B64, {'a': 1}])
+        # A null value is not JSON text.
+        self.assertIsNone(BallotOption.objects.get(pk=ballot_option.pk).zk2)
+
+    def test_ballot_list_renders_raw_json(self):
+        # The stored JSON text (not in the canonical format) is copied to the
+        # response as-is, and the response is still valid JSON.
+        BallotQuestion.objects.filter(part__is_cast=True).update(zk2=RawJSON('[ "%s" ]' % B64))
+        url = reverse('bulletin-board:api:ballot-list', kwargs={'election_slug': self.election.slug})
+        r = APIClient().get(url, format='json')
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+        self.assertEqual(r.content.count(('"zk2":[ "%s" ]' % B64).encode('ascii')), 1)
+        questions = [question for part in r.json()['results'][0]['parts'] for question in part['questions']]
+        self.assertEqual(sorted(question['zk2'] for question in questions if question['zk2']), [[B64]])
+
+
+class TallyUpdateBallotTests(TestCase):
+    """
+    The trustees' submission of the ballots' partial decommitments and ZK2,
+    one ballot at a time and in bulk.
+    """
+
+    ballot_count = 3
+
+    def setUp(self):
+        self.election = create_election(Election.STATE_TALLY, self.ballot_count)
+        user = get_user_model().objects.create_user('trustee', 'trustee@example.com')
+        self.trustee = Trustee.objects.create(election=self.election, user=user)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        self.ballots_url = reverse('bulletin-board:api:ballot-list', kwargs={'election_slug': self.election.slug})
+
+    def get_ballot_data(self, serial_number=None):
+        # The question has 2 options, 1 of which is non-blank. Part A is cast.
+        ballot_data = {
+            'parts': [
+                {'questions': [{'zk2': [B64] * 7, 'options': [{'zk2': [B64] * 3}, {'zk2': [B64] * 3}]}]},
+                {'questions': [{'options': [{'decommitment': [B64]}, {'decommitment': [B64]}]}]},
+            ],
+        }
+        if serial_number is not None:
+            ballot_data['serial_number'] = serial_number
+        return ballot_data
+
+    def assertSubmitted(self, ballot_count):
+        trustee = Trustee.objects.get(pk=self.trustee.pk)
+        self.assertEqual(trustee.submitted_ballot_count, ballot_count)
+        self.assertEqual(PartialQuestionZK2.objects.filter(trustee=trustee).count(), ballot_count)
+        self.assertEqual(PartialOptionZK2.objects.filter(trustee=trustee).count(), 2 * ballot_count)
+        self.assertEqual(PartialDecommitment.objects.filter(trustee=trustee).count(), 2 * ballot_count)
+
+    def test_update_ballot(self):
+        r = self.client.patch(self.ballots_url + '100/', self.get_ballot_data(), format='json')
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+        self.assertSubmitted(1)
+        # A re-submitted ballot replaces the previous values.
+        r = self.client.patch(self.ballots_url + '100/', self.get_ballot_data(), format='json')
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+        self.assertSubmitted(1)
+
+    def test_bulk_update_ballots(self):
+        data = [self.get_ballot_data(serial_number) for serial_number in range(100, 100 + self.ballot_count)]
+        r = self.client.patch(self.ballots_url + 'bulk/', data, format='json')
+        self.assertEqual(r.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertSubmitted(self.ballot_count)
+        self.assertTrue(Trustee.objects.get(pk=self.trustee.pk).has_submitted_all_ballots)
+        # A re-submitted ballot replaces the previous values.
+        r = self.client.patch(self.ballots_url + 'bulk/', data[:1], format='json')
+        self.assertEqual(r.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertSubmitted(self.ballot_count)
 
-# Create your tests here.
+    def test_bulk_update_ballots_invalid(self):
+        data = [self.get_ballot_data(100), self.get_ballot_data(100), self.get_ballot_data(999)]
+        r = self.client.patch(self.ballots_url + 'bulk/', data, format='json')
+        self.assertEqual(r.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(r.data[0], {})
+        self.assertIn('serial_number', r.data[1])
+        self.assertIn('serial_number', r.data[2])
+        self.assertSubmitted(0)
@@ -5,10 +5,16 @@ from base64 import b64decode, b64encode as _b64encode
 from django.utils.encoding import force_text
 
 from petlib.bn import Bn
-from petlib.ec import EcGroup, EcPt
+from petlib.ec import POINT_CONVERSION_COMPRESSED, EcPt
 
 from six.moves import zip
 
+from demos_voting.base.utils.crypto import get_crypto_context
+
+# EC points are exported in compressed form. `EcPt.from_binary` accepts both
+# the compressed and the uncompressed form.
+POINT_FORMAT = POINT_CONVERSION_COMPRESSED
+
 
 def b64encode(*args, **kwargs):
     return force_text(_b64encode(*args, **kwargs))
@@ -19,7 +25,7 @@ def add_com(commitments, nid=415):
     Add a list of commitments, nid is the curve ID. It returns the combined
     commitment.
     """
-    G = EcGroup(nid)
+    G = get_crypto_context(nid=nid).G
     ec_s1s = []
     ec_s2s = []
     for commitment in commitments:
@@ -33,7 +39,7 @@ def add_com(commitments, nid=415):
             ec_s1s[i] += EcPt.from_binary(b64decode(c['C1']), G)
             ec_s2s[i] += EcPt.from_binary(b64decode(c['C2']), G)
     return [
-        {'C1': b64encode(ec_s1.export()), 'C2': b64encode(ec_s2.export())}
+        {'C1': b64encode(ec_s1.export(POINT_FORMAT)), 'C2': b64encode(ec_s2.export(POINT_FORMAT))}
         for ec_s1, ec_s2 in zip(ec_s1s, ec_s2s)
     ]
 
@@ -43,8 +49,7 @@ def add_decom(decommitments, nid=415):
     Add a list of decommitments, nid is the curve ID. It returns the combined
     decommitment.
     """
-    G = EcGroup(nid)
-    order = G.order()
+    order = get_crypto_context(nid=nid).order
     bn_sums = []
     for decommitment in decommitments:
         if not bn_sums and decommitment:
@@ -59,26 +64,98 @@ def add_decom(decommitments, nid=415):
 
 def extract(h, commitment, decommitment, max_plaintext, nid=415):
     """
-    Take the decommitment and brute force the plaintext. h is the public key
-    and nid is the curve ID. It returns the plaintexts.
+    Take the decommitment and find the plaintext, in range 0 to max_plaintext,
+    with baby-step giant-step. h is the public key and nid is the curve ID. It
+    returns the plaintexts.
     """
-    G = EcGroup(nid)
-    ec_g = G.generator()
-    ec_h = EcPt.from_binary(b64decode(h), G)
-    plaintexts = []
+    crypto_context = get_crypto_context(h, nid)
+    G = crypto_context.G
+    ec_g = crypto_context.ec_g
+    ec_h = crypto_context.ec_h
+    # plaintext = i * m + j, where j * g is looked up in the table of the baby
+    # steps and i is the number of giant steps (m * g). m is rounded up to a
+    # power of 2, so that the tables can be reused.
+    m = 1
+    while m * m < max_plaintext + 1:
+        m <<= 1
+    baby_steps = crypto_context.get_baby_steps(m)
+    ec_giant_step = Bn(m) * ec_g
+    ec_c1s = []
+    ec_c2s = []
+    bn_rs = []
     for c, d in zip(commitment, decommitment):
-        ec_c1 = EcPt.from_binary(b64decode(c['C1']), G)
-        ec_c2 = EcPt.from_binary(b64decode(c['C2']), G)
-        bn_r = Bn.from_binary(b64decode(d))
-        if ec_c1 != bn_r * ec_g:
-            raise ValueError("Invalid decommitment.")
+        ec_c1s.append(EcPt.from_binary(b64decode(c['C1']), G))
+        ec_c2s.append(EcPt.from_binary(b64decode(c['C2']), G))
+        bn_rs.append(Bn.from_binary(b64decode(d)))
+    if not verify_decom_batch(G, ec_c1s, bn_rs):
+        raise ValueError("Invalid decommitment.")
+    plaintexts = []
+    for ec_c2, bn_r in zip(ec_c2s, bn_rs):
         ec_temp = ec_c2 - bn_r * ec_h
-        ec_sum = G.infinite()
-        for i in range(max_plaintext + 1):
-            if ec_temp == ec_sum:
-                plaintexts.append(i)
+        for i in range(max_plaintext // m + 1):
+            j = baby_steps.get(ec_temp.export())
+            if j is not None:
+                plaintext = i * m + j
                 break
-            ec_sum += ec_g
+            ec_temp = ec_temp - ec_giant_step
+        else:
+            plaintext = None
+        if plaintext is None or plaintext > max_plaintext:
+            raise ValueError("Maximum limit reached.")
+        plaintexts.append(plaintext)
+    return plaintexts
+
+
+def extract_bits(h, commitment, decommitment, nid=415):
+    """
+    The same as `extract` with max_plaintext 1, but each plaintext is found by
+    comparing the decommitted point to the identity and the generator, without
+    a table of baby steps.
+    """
+    crypto_context = get_crypto_context(h, nid)
+    G = crypto_context.G
+    ec_g = crypto_context.ec_g
+    ec_h = crypto_context.ec_h
+    ec_c1s = []
+    ec_c2s = []
+    bn_rs = []
+    for c, d in zip(commitment, decommitment):
+        ec_c1s.append(EcPt.from_binary(b64decode(c['C1']), G))
+        ec_c2s.append(EcPt.from_binary(b64decode(c['C2']), G))
+        bn_rs.append(Bn.from_binary(b64decode(d)))
+    if not verify_decom_batch(G, ec_c1s, bn_rs):
+        raise ValueError("Invalid decommitment.")
+    plaintexts = []
+    for ec_c2, bn_r in zip(ec_c2s, bn_rs):
+        ec_temp = ec_c2 - bn_r * ec_h
+        if ec_temp.is_infinite():
+            plaintexts.append(0)
+        elif ec_temp == ec_g:
+            plaintexts.append(1)
         else:
             raise ValueError("Maximum limit reached.")
     return plaintexts
+
+
+def verify_decom_batch(G, ec_c1s, bn_rs):
+    """
+    Check that C1 = r * g for all pairs of C1 and r. The pairs are verified in
+    a single batch, with one multi-scalar multiplication: the sum of a_i * C1_i
+    must be equal to (the sum of a_i * r_i) * g, for random 128-bit a_i. Only if
+    the batch check fails are the pairs checked one by one. It returns True if
+    all pairs are valid.
+    """
+    ec_g = G.generator()
+    order = G.order()
+    if len(ec_c1s) > 1:
+        bn_bound = Bn(2).pow(128)
+        bn_as = [bn_bound.random() for _ in ec_c1s]
+        bn_sum = Bn(0)
+        for bn_a, bn_r in zip(bn_as, bn_rs):
+            bn_sum = bn_sum.mod_add(bn_a.mod_mul(bn_r, order), order)
+        if G.wsum(bn_as, ec_c1s) == bn_sum * ec_g:
+            return True
+    for ec_c1, bn_r in zip(ec_c1s, bn_rs):
+        if ec_c1 != bn_r * ec_g:
+            return False
+    return True
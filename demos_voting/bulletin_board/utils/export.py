@@ -0,0 +1,36 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from demos_voting.bulletin_board.renderers import JSONRenderer
+from demos_voting.bulletin_board.serializers import BallotSerializer
+
+CONTENT_TYPE = 'application/x-ndjson'
+CHUNK_SIZE = 100  # ballots
+
+# The hyperlinks are omitted, they require the request.
+FIELDS = {
+    'url': False,
+    'election_url': False,
+}
+
+
+def iter_ballots(election, chunk_size=CHUNK_SIZE):
+    """
+    Yield the election's ballots with their proofs, as newline-delimited JSON
+    (one line of bytes per ballot) in serial number order. The ballots are
+    fetched in chunks, continuing from the last serial number of the previous
+    chunk, so that the memory usage is bounded.
+    """
+    renderer = JSONRenderer()
+    queryset = election.ballots.order_by('serial_number').prefetch_related('parts__questions__options')
+    serial_number = None
+    while True:
+        ballots = queryset if serial_number is None else queryset.filter(serial_number__gt=serial_number)
+        ballots = list(ballots[:chunk_size])
+        if not ballots:
+            break
+        for ballot in ballots:
+            ballot.election = election  # force-"prefetch" the election
+        serializer = BallotSerializer(ballots, many=True, fields=FIELDS)
+        for ballot_data in serializer.data:
+            yield renderer.render(ballot_data) + b'\n'
+        serial_number = ballots[-1].serial_number
@@ -11,7 +11,7 @@ from django.views.generic.detail import SingleObjectMixin
 
 from rest_framework import status
 from rest_framework.authentication import SessionAuthentication, TokenAuthentication
-from rest_framework.decorators import detail_route
+from rest_framework.decorators import detail_route, list_route
 from rest_framework.mixins import CreateModelMixin, ListModelMixin, RetrieveModelMixin, UpdateModelMixin
 from rest_framework.parsers import JSONParser
 from rest_framework.permissions import IsAuthenticated
@@ -27,15 +27,17 @@ from demos_voting.bulletin_board.models import (
     Ballot, BallotOption, BallotQuestion, Election, ElectionOption,
 )
 from demos_voting.bulletin_board.pagination import LimitOffsetPagination
+from demos_voting.bulletin_board.parsers import NDJSONParser
 from demos_voting.bulletin_board.permissions import (
-    CanCreateBallot, CanCreateElection, CanCreateTrustee, CanCreateVoter, CanUpdateBallot, CanUpdateElection,
-    CanViewBallot, CanViewElection, DenyAll,
+    CanCreateBallot, CanCreateElection, CanCreateTrustee, CanCreateVoter, CanUpdateBallot, CanUpdateBallots,
+    CanUpdateElection, CanViewBallot, CanViewElection, DenyAll,
 )
 from demos_voting.bulletin_board.renderers import BrowsableAPIRenderer, JSONRenderer
 from demos_voting.bulletin_board.serializers import (
     BallotSerializer, CreateBallotSerializer, CreateElectionSerializer, CreateTrusteeSerializer, CreateVoterSerializer,
-    ElectionSerializer, UpdateBallotSerializer, UpdateElectionSerializer,
+    ElectionSerializer, TallyUpdateBallotSerializer, UpdateBallotSerializer, UpdateElectionSerializer,
 )
+from demos_voting.bulletin_board.utils import export
 from demos_voting.bulletin_board.utils.query_params import parse_fields_qs
 
 
@@ -211,7 +213,11 @@ class TallyView(PermissionRequiredMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super(TallyView, self).get_context_data(**kwargs)
         context['trustee'] = self.object.trustees.get(user=self.request.user)
-        context['cast_ballot_count'] = self.object.ballots.filter(parts__is_cast=True).distinct().count()
+        cast_ballot_count = self.object.cast_ballot_count
+        if cast_ballot_count is None:
+            # The tally phase's preparation has not finished yet.
+            cast_ballot_count = self.object.ballots.filter(parts__is_cast=True).distinct().count()
+        context['cast_ballot_count'] = cast_ballot_count
         return context
 
 
@@ -382,6 +388,41 @@ class BallotViewSet(DynamicFieldsMixin, SelectForUpdateMixin, ListModelMixin, Re
             kwargs['many'] = True
         return super(BallotViewSet, self).get_serializer(*args, **kwargs)
 
+    @list_route(methods=('get',), url_path='export', permission_classes=[CanViewBallot])
+    def export_ballots(self, request, election_slug=None):
+        """
+        Download all the election's ballots with their proofs, as newline-
+        delimited JSON. The response is streamed, or it is served from the
+        pre-generated file once the election has been completed.
+        """
+        election = self.election
+        if election.state == election.STATE_COMPLETED and election.ballot_export_file:
+            response = http.FileResponse(election.ballot_export_file, content_type=export.CONTENT_TYPE)
+        else:
+            response = http.StreamingHttpResponse(export.iter_ballots(election), content_type=export.CONTENT_TYPE)
+        response['Content-Disposition'] = 'attachment; filename="ballots.ndjson"'
+        return response
+
+    @list_route(methods=('patch',), url_path='bulk', permission_classes=[CanUpdateBallots],
+                parser_classes=(JSONParser, NDJSONParser))
+    def bulk_update(self, request, election_slug=None):
+        """
+        Update many ballots at once (tally phase only). The data is a list of
+        ballots, either as a JSON array or as newline-delimited JSON, and each
+        ballot also contains its serial number.
+        """
+        # The election's questions are used to validate every ballot.
+        prefetch_related_objects([self.election], 'questions__options')
+        serializer = TallyUpdateBallotSerializer(
+            self.get_queryset(),
+            data=request.data,
+            context=self.get_serializer_context(),
+            many=True,
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 class APIRootView(BaseAPIRootView):
     parser_classes = (JSONParser,)
@@ -71,6 +71,14 @@ class Election(BaseElection):
     def _crypto(self):
         return crypto.key_gen(self.trustees.count())
 
+    @cached_property
+    def _crypto_context(self):
+        return crypto.ElectionContext(
+            [trustee.secret_key for trustee in self.trustees.all()],  # trustee keys
+            self.commitment_key,  # commitment key
+            [[int(not option.is_blank) for option in question.options.all()] for question in self.questions.all()],
+        )
+
     def generate_private_key(self):
         """
         If the vote-code type is long then generate the election's private key.
@@ -353,14 +361,15 @@ class BallotQuestion(BaseBallotQuestion):
 
     @cached_property
     def _crypto(self):
-        return crypto.ballot_gen(
-            [trustee.secret_key for trustee in self.election.trustees.all()],  # trustee keys
-            self.election.commitment_key,  # commitment key
-            [int(not option.is_blank) for option in self.election_question.options.all()],  # option bitmask
-            self.permutation,  # permutation array
+        return crypto.ballot_gen_batch(self.election._crypto_context, [self._crypto_job])[0]
+
+    @cached_property
+    def _crypto_job(self):
+        return (
             self.ballot.serial_number,  # ballot serial number
             self.part.tag,  # part tag
             self.election_question.index,  # question index
+            self.permutation,  # permutation array
         )
 
     @cached_property
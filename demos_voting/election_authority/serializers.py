@@ -4,7 +4,9 @@ from cryptography.hazmat.primitives.serialization import Encoding
 
 from rest_framework import serializers
 
+from demos_voting.base.fields import PackedField
 from demos_voting.base.serializers import DynamicFieldsMixin
+from demos_voting.base.utils import packing
 from demos_voting.election_authority.models import (
     Administrator, Ballot, BallotOption, BallotPart, BallotQuestion, Election, ElectionOption, ElectionQuestion,
     Trustee,
@@ -109,8 +111,8 @@ class BallotDistributorBallotSerializer(serializers.ModelSerializer):
 
 class BulletinBoardBallotOptionSerializer(serializers.ModelSerializer):
     vote_code = serializers.SerializerMethodField()
-    commitment = serializers.JSONField()
-    zk1 = serializers.JSONField()
+    commitment = PackedField(packing.COMMITMENT)
+    zk1 = PackedField(packing.OPTION_ZK1)
 
     class Meta:
         model = BallotOption
@@ -126,7 +128,7 @@ class BulletinBoardBallotOptionSerializer(serializers.ModelSerializer):
 
 class BulletinBoardBallotQuestionSerializer(serializers.ModelSerializer):
     options = BulletinBoardBallotOptionSerializer(many=True, allow_empty=False)
-    zk1 = serializers.JSONField()
+    zk1 = PackedField(packing.QUESTION_ZK1)
 
     class Meta:
         model = BallotQuestion
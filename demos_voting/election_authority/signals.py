@@ -28,7 +28,7 @@ def end_setup_phase(election, **kwargs):
         # been successfully notified.
         api_session_classes = [BallotDistributorAPISession, VoteCollectorAPISession, BulletinBoardAPISession]
         for api_session_class in reversed(api_session_classes):
-            with api_session_class() as s:
+            with api_session_class.borrow() as s:
                 serializer = ElectionSerializer(instance=election, fields=['state'])
                 r = s.patch('elections/%s/' % election.slug, json=serializer.data)
                 r.raise_for_status()
@@ -1,6 +1,12 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import collections
+import itertools
+import json
 import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+import billiard
 
 from celery import chord, shared_task
 from celery.signals import task_failure
@@ -13,6 +19,7 @@ from django.utils import timezone
 from six.moves import range
 
 from demos_voting.base.utils import get_range_in_chunks
+from demos_voting.base.utils.api import StreamingBody
 from demos_voting.election_authority.models import Ballot, BallotOption, BallotPart, BallotQuestion, Election
 from demos_voting.election_authority.serializers import (
     BallotDistributorBallotSerializer, BulletinBoardBallotSerializer, ElectionSerializer, TrusteeSerializer,
@@ -21,8 +28,12 @@ from demos_voting.election_authority.serializers import (
 from demos_voting.election_authority.utils.api import (
     BallotDistributorAPISession, BulletinBoardAPISession, VoteCollectorAPISession,
 )
+from demos_voting.election_authority.utils import crypto
 
 TASK_CONCURRENCY = getattr(settings, 'DEMOS_VOTING_TASK_CONCURRENCY', None) or multiprocessing.cpu_count()
+CRYPTO_WORKERS = getattr(settings, 'DEMOS_VOTING_CRYPTO_WORKERS', None) or 0
+BALLOT_BATCH_SIZE = 100  # ballots
+BALLOT_BATCH_MAX_BYTES = 8 * 1024 * 1024  # must be less than the servers' `DATA_UPLOAD_MAX_MEMORY_SIZE`
 
 
 # Setup phase tasks ###########################################################
@@ -46,7 +57,7 @@ def prepare_setup_phase(election_pk):
     election.save(update_fields=['commitment_key', 'private_key_file', 'certificate_file'])
     # Send the election's objects to the other servers.
     for api_session_class in (BallotDistributorAPISession, VoteCollectorAPISession, BulletinBoardAPISession):
-        with api_session_class() as s:
+        with api_session_class.borrow() as s:
             serializer = ElectionSerializer(election)
             r = s.post('elections/', json=serializer.data)
             r.raise_for_status()
@@ -55,7 +66,7 @@ def prepare_setup_phase(election_pk):
         trustee.generate_secret_key(index)
         trustee.save()
     # Send the trustees to the Bulletin Board.
-    with BulletinBoardAPISession() as s:
+    with BulletinBoardAPISession.borrow() as s:
         serializer = TrusteeSerializer(election.trustees.all(), many=True)
         r = s.post('elections/%s/trustees/' % election.slug, json=serializer.data)
         r.raise_for_status()
@@ -81,45 +92,176 @@ def generate_ballots(self, election_pk, range_start, range_stop):
         return
     assert election.state == election.STATE_SETUP
     # Generate the ballots. The ballots are not saved in the local database.
-    # The ballots are sent to the other servers one by one, as a serialized
-    # ballot can be up to a few megabytes long.
-    for i, serial_number in enumerate(range(range_start + 100, range_stop + 100)):
-        ballot = Ballot(election=election, serial_number=serial_number)
-        ballot._parts = []
-        for tag in (BallotPart.TAG_A, BallotPart.TAG_B):
-            ballot_part = BallotPart(ballot=ballot, tag=tag)
-            ballot_part.generate_credential()
-            ballot_part.generate_credential_hash()
-            ballot_part.generate_security_code()
-            ballot_part._questions = []
-            for election_question in election.questions.all():
-                ballot_question = BallotQuestion(part=ballot_part, election_question=election_question)
-                ballot_question.generate_zk1()
-                ballot_question._options = []
-                for index in range(election_question.option_count):
-                    ballot_option = BallotOption(question=ballot_question, index=index)
-                    ballot_option.generate_vote_code()
-                    ballot_option.generate_vote_code_hash()
-                    ballot_option.generate_receipt()
-                    ballot_option.generate_commitment()
-                    ballot_option.generate_zk1()
-                    ballot_question._options.append(ballot_option)
-                ballot_part._questions.append(ballot_question)
-            ballot._parts.append(ballot_part)
-        # Send the ballot's object to the other servers. Each server gets a
-        # different subset of the ballot's attributes.
-        api_classes = (
-            (BallotDistributorAPISession, BallotDistributorBallotSerializer),
-            (VoteCollectorAPISession, VoteCollectorBallotSerializer),
-            (BulletinBoardAPISession, BulletinBoardBallotSerializer),
+    # The ballots are sent to the other servers in batches, which are bounded
+    # both in number of ballots and in size, as a serialized ballot can be up
+    # to a few megabytes long. Each server gets a different subset of the
+    # ballot's attributes. One session is used per server for the whole task.
+    # The batches are sent to the servers concurrently, in a thread pool, while
+    # the next ballots are being generated.
+    serial_numbers = range(range_start + 100, range_stop + 100)
+    ballots = (_create_ballot(election, serial_number) for serial_number in serial_numbers)
+    with BallotDistributorAPISession.borrow() as bd_session, VoteCollectorAPISession.borrow() as vc_session, \
+            BulletinBoardAPISession.borrow() as bb_session:
+        upload_pool = ThreadPool(processes=3)
+        try:
+            ballot_batches = [
+                _BallotBatch(election, bd_session, BallotDistributorBallotSerializer, upload_pool),
+                _BallotBatch(election, vc_session, VoteCollectorBallotSerializer, upload_pool),
+                _BallotBatch(election, bb_session, BulletinBoardBallotSerializer, upload_pool),
+            ]
+            for i, ballot in enumerate(_generate_ballot_crypto(election, ballots)):
+                # Generate the ballot's options.
+                for ballot_part in ballot._parts:
+                    for ballot_question in ballot_part._questions:
+                        ballot_question.generate_zk1()
+                        ballot_question._options = []
+                        for index in range(ballot_question.election_question.option_count):
+                            ballot_option = BallotOption(question=ballot_question, index=index)
+                            ballot_option.generate_vote_code()
+                            ballot_option.generate_vote_code_hash()
+                            ballot_option.generate_receipt()
+                            ballot_option.generate_commitment()
+                            ballot_option.generate_zk1()
+                            ballot_question._options.append(ballot_option)
+                # Add the ballot to the batches of the other servers.
+                for ballot_batch in ballot_batches:
+                    ballot_batch.add(ballot)
+                # Update the task's progress.
+                self.update_state(state='PROGRESS', meta={'current': i, 'total': range_stop - range_start})
+            for ballot_batch in ballot_batches:
+                ballot_batch.flush()
+            # Wait for all batches to be sent. An upload's exception is raised
+            # here, so that the task fails.
+            for ballot_batch in ballot_batches:
+                ballot_batch.wait()
+        finally:
+            upload_pool.terminate()
+            upload_pool.join()
+
+
+class _BallotBatch(object):
+    """
+    A batch of serialized ballots for one of the other servers. The batch is
+    sent (as a JSON list) when the next ballot would exceed its limits. It is
+    sent in the background, in the upload pool. At most one batch per server
+    is pending, so that the session (borrowed by the task's thread) is used by
+    one thread at a time.
+    """
+
+    def __init__(self, election, session, serializer_class, upload_pool):
+        self.election = election
+        self.session = session
+        self.serializer_class = serializer_class
+        self.upload_pool = upload_pool
+        self.body = StreamingBody()
+        self.ballot_count = 0
+        self.pending_result = None
+
+    def add(self, ballot):
+        serializer = self.serializer_class(ballot, context={'election': self.election})
+        data = json.dumps(serializer.data, separators=(',', ':'))
+        if self.ballot_count and (
+            self.ballot_count >= BALLOT_BATCH_SIZE or len(self.body) + len(data) + 2 > BALLOT_BATCH_MAX_BYTES
+        ):
+            self.flush()
+        self.body.write(b',' if self.ballot_count else b'[')
+        self.body.write(data)
+        self.ballot_count += 1
+
+    def flush(self):
+        self.wait()
+        if not self.ballot_count:
+            return
+        body = self.body
+        body.write(b']')
+        self.body = StreamingBody()
+        self.ballot_count = 0
+        self.pending_result = self.upload_pool.apply_async(self._send, (body,))
+
+    def wait(self):
+        if self.pending_result is not None:
+            pending_result, self.pending_result = self.pending_result, None
+            pending_result.get()  # re-raises the upload's exception
+
+    def _send(self, body):
+        r = self.session.post(
+            'elections/%s/ballots/' % self.election.slug,
+            data=body,
+            headers={'Content-Type': 'application/json'},
         )
-        for api_session_class, ballot_serializer_class in api_classes:
-            with api_session_class() as s:
-                serializer = ballot_serializer_class(ballot, context={'election': election})
-                r = s.post('elections/%s/ballots/' % election.slug, json=serializer.data)
-                r.raise_for_status()
-        # Update the task's progress.
-        self.update_state(state='PROGRESS', meta={'current': i, 'total': range_stop - range_start})
+        r.raise_for_status()
+
+
+def _create_ballot(election, serial_number):
+    """
+    Create a ballot with its parts and questions, but without their crypto.
+    """
+    ballot = Ballot(election=election, serial_number=serial_number)
+    ballot._parts = []
+    for tag in (BallotPart.TAG_A, BallotPart.TAG_B):
+        ballot_part = BallotPart(ballot=ballot, tag=tag)
+        ballot_part.generate_credential()
+        ballot_part.generate_credential_hash()
+        ballot_part.generate_security_code()
+        ballot_part._questions = []
+        for election_question in election.questions.all():
+            ballot_question = BallotQuestion(part=ballot_part, election_question=election_question)
+            ballot_part._questions.append(ballot_question)
+        ballot._parts.append(ballot_part)
+    return ballot
+
+
+def _generate_ballot_crypto(election, ballots):
+    """
+    Generate the commitments and the zero-knowledge proofs of all the ballots'
+    questions, one batch per ballot, and yield the ballots in order. If
+    `CRYPTO_WORKERS` is set then the batches are generated by a pool of
+    worker processes, a few ballots ahead of the one that is yielded, so that
+    the crypto overlaps with sending the ballots to the other servers.
+    """
+    election_ctx = election._crypto_context
+    if not CRYPTO_WORKERS:
+        for ballot in ballots:
+            ballot_questions = [q for ballot_part in ballot._parts for q in ballot_part._questions]
+            crypto_results = crypto.ballot_gen_batch(election_ctx, [q._crypto_job for q in ballot_questions])
+            for ballot_question, crypto_result in zip(ballot_questions, crypto_results):
+                ballot_question._crypto = crypto_result
+            yield ballot
+        return
+    # Celery's worker processes are daemonic, billiard's pool can be used
+    # inside them (unlike multiprocessing's pool).
+    pool = billiard.Pool(CRYPTO_WORKERS, initializer=_crypto_worker_init, initargs=(election_ctx,))
+    try:
+        pending = collections.deque()
+        ballots = iter(ballots)
+        while True:
+            # Keep up to two batches per worker process in flight.
+            for ballot in itertools.islice(ballots, 2 * CRYPTO_WORKERS - len(pending)):
+                ballot_questions = [q for ballot_part in ballot._parts for q in ballot_part._questions]
+                crypto_jobs = [q._crypto_job for q in ballot_questions]
+                async_result = pool.apply_async(_crypto_worker_ballot_gen_batch, (crypto_jobs,))
+                pending.append((ballot, ballot_questions, async_result))
+            if not pending:
+                break
+            ballot, ballot_questions, async_result = pending.popleft()
+            for ballot_question, crypto_result in zip(ballot_questions, async_result.get()):
+                ballot_question._crypto = crypto_result
+            yield ballot
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+_crypto_worker_election_ctx = None
+
+
+def _crypto_worker_init(election_ctx):
+    global _crypto_worker_election_ctx
+    _crypto_worker_election_ctx = election_ctx
+
+
+def _crypto_worker_ballot_gen_batch(crypto_jobs):
+    return crypto.ballot_gen_batch(_crypto_worker_election_ctx, crypto_jobs)
 
 
 @shared_task(ignore_result=True)
@@ -1,26 +1,88 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import hashlib
+import hmac
 from base64 import b64decode, b64encode as _b64encode
 
 from django.utils.encoding import force_bytes, force_text
 
-from petlib.bn import Bn
-from petlib.ec import EcGroup, EcPt
-from petlib.hmac import Hmac
+from petlib.bindings import _C, _FFI
+from petlib.bn import Bn, get_ctx
+from petlib.ec import POINT_CONVERSION_COMPRESSED, EcPt
+
+from demos_voting.base.utils.compat import int_from_bytes
+from demos_voting.base.utils.crypto import get_crypto_context
+
+# EC points are exported in compressed form. `EcPt.from_binary` accepts both
+# the compressed and the uncompressed form.
+POINT_FORMAT = POINT_CONVERSION_COMPRESSED
 
 
 def b64encode(*args, **kwargs):
     return force_text(_b64encode(*args, **kwargs))
 
 
+class FixedBase(object):
+    """
+    Fixed-base scalar multiplication for the generator `g` and the commitment
+    key `h`. Multiples of `g` are computed with the generator's precomputed
+    table, which OpenSSL builds once per group (`EcGroup` calls
+    `EC_GROUP_precompute_mult`). If the discrete logarithm of `h` is known
+    (during the setup phase it is the sum of the trustee keys) then multiples
+    of `h` are reduced to multiples of `g`, otherwise they fall back to
+    generic scalar multiplication.
+    """
+
+    def __init__(self, G, ec_h, bn_log_h=None):
+        self.G = G
+        self.order = G.order()
+        self.ec_h = ec_h
+        if bn_log_h is not None:
+            bn_log_h = bn_log_h.mod(self.order)
+            if self._mul(bn_log_h) != ec_h:
+                bn_log_h = None  # not the discrete logarithm of h
+        self.bn_log_h = bn_log_h
+
+    def _mul(self, bn_a, ec_p=None, bn_b=None):
+        # Compute a * g + b * p, where the first term uses the generator's
+        # precomputed table.
+        ec_r = EcPt(self.G)
+        if not _C.EC_POINT_mul(self.G.ecg, ec_r.pt, bn_a.bn, ec_p.pt if ec_p is not None else _FFI.NULL,
+                               bn_b.bn if bn_b is not None else _FFI.NULL, get_ctx().bnctx):
+            raise RuntimeError("Scalar multiplication failed.")
+        return ec_r
+
+    def g(self, bn_a):
+        """
+        Return a * g.
+        """
+        return self._mul(bn_a)
+
+    def h(self, bn_b):
+        """
+        Return b * h.
+        """
+        if self.bn_log_h is None:
+            return bn_b * self.ec_h
+        return self._mul(bn_b.mod_mul(self.bn_log_h, self.order))
+
+    def gh(self, bn_a, bn_b):
+        """
+        Return a * g + b * h.
+        """
+        if self.bn_log_h is None:
+            return self._mul(bn_a, self.ec_h, bn_b)
+        return self._mul(bn_a.mod_add(bn_b.mod_mul(self.bn_log_h, self.order), self.order))
+
+
 def key_gen(t_num, nid=415):
     """
     Key generation, t_num is the number of trustees, nid is the curve ID. It
     returns a list of trustee keys and the public key of the election.
     """
-    G = EcGroup(nid)
-    ec_g = G.generator()
-    order = G.order()
+    crypto_context = get_crypto_context(nid=nid)
+    ec_g = crypto_context.ec_g
+    order = crypto_context.order
     bn_tk = []
     bn_sk = Bn(0)
     for i in range(t_num):
@@ -28,7 +90,56 @@ def key_gen(t_num, nid=415):
         bn_sk += bn_temp
         bn_tk.append(b64encode(bn_temp.binary()))
     ec_h = bn_sk * ec_g
-    return bn_tk, b64encode(ec_h.export())
+    return bn_tk, b64encode(ec_h.export(POINT_FORMAT))
+
+
+class ElectionContext(object):
+    """
+    The election's ballot generation parameters, decoded once and reused for
+    every ballot. str_tk is the list of trustee keys, str_h is the public key,
+    bitmasks is the list of the questions' option bitmasks (see `ballot_gen`)
+    and nid is the curve ID.
+    """
+
+    def __init__(self, str_tk, str_h, bitmasks, nid=415):
+        self._args = (list(str_tk), str_h, [list(bitmask) for bitmask in bitmasks], nid)
+        # read pk = h
+        crypto_context = get_crypto_context(str_h, nid)
+        self.G = crypto_context.G
+        self.ec_g = crypto_context.ec_g
+        self.order = crypto_context.order
+        self.ec_h = crypto_context.ec_h
+        # read tk
+        self.tk = []
+        for k in str_tk:
+            self.tk.append(b64decode(k))
+        # h = sk * g, where sk is the sum of the trustee keys
+        bn_sk = Bn(0)
+        for k in self.tk:
+            bn_sk = bn_sk.mod_add(Bn.from_binary(k), self.order)
+        self.fb = FixedBase(self.G, self.ec_h, bn_sk)
+        self.bitmasks = [list(bitmask) for bitmask in bitmasks]
+        # one keyed HMAC-SHA256 per trustee, copied for each message
+        self._tk_hmacs = [hmac.new(k, digestmod=hashlib.sha256) for k in self.tk]
+        self._int_order = int(self.order)
+
+    def __reduce__(self):
+        # The context is pickled by its arguments (e.g. for sending it to a
+        # worker process), it is decoded again when it is unpickled.
+        return self.__class__, self._args
+
+    def hmac_sum(self, msgs):
+        """
+        Return the sum of hmac_tk{msg} mod order for each one of msgs, where tk
+        ranges over all trustee keys.
+        """
+        int_sums = [0] * len(msgs)
+        for tk_hmac in self._tk_hmacs:
+            for index, msg in enumerate(msgs):
+                h = tk_hmac.copy()
+                h.update(msg)
+                int_sums[index] += int_from_bytes(h.digest(), byteorder='big')
+        return [Bn.from_decimal(str(int_sum % self._int_order)) for int_sum in int_sums]
 
 
 def ballot_gen(str_tk, str_h, bitmask, permutation, ballot_serial_number, part_tag, question_index, nid=415):
@@ -38,15 +149,38 @@ def ballot_gen(str_tk, str_h, bitmask, permutation, ballot_serial_number, part_t
     permutation is the permutation array and nid is the curveID. It returns the
     ballot part.
     """
-    G = EcGroup(nid)
-    ec_g = G.generator()
-    order = G.order()
-    # read pk = h
-    ec_h = EcPt.from_binary(b64decode(str_h), G)
-    # read tk
-    tk = []
-    for k in str_tk:
-        tk.append(b64decode(k))
+    election_ctx = ElectionContext(str_tk, str_h, [], nid)
+    return _ballot_gen(election_ctx, bitmask, permutation, ballot_serial_number, part_tag, question_index)
+
+
+def ballot_gen_batch(election_ctx, jobs):
+    """
+    Batch ballot generation, election_ctx is the election's context and jobs
+    is a list of (ballot_serial_number, part_tag, question_index, permutation)
+    tuples. It returns a list of ballot parts, one for each job, in the same
+    format as `ballot_gen`.
+    """
+    results = []
+    for ballot_serial_number, part_tag, question_index, permutation in jobs:
+        bitmask = election_ctx.bitmasks[question_index]
+        results.append(
+            _ballot_gen(election_ctx, bitmask, permutation, ballot_serial_number, part_tag, question_index)
+        )
+    return results
+
+
+def _ballot_gen(election_ctx, bitmask, permutation, ballot_serial_number, part_tag, question_index):
+    ec_g = election_ctx.ec_g
+    order = election_ctx.order
+    fb = election_ctx.fb
+    bitmask = list(bitmask)  # the bitmask is modified below
+
+    # all hmac messages start with the ballot serial number, the part tag and
+    # the question index
+    msg_prefix = b",".join(force_bytes(v) for v in [ballot_serial_number, part_tag, question_index])
+
+    def msg(*values):
+        return b",".join([msg_prefix] + [force_bytes(v) for v in values])
 
     n = len(bitmask)
     assert n == len(permutation)
@@ -73,13 +207,10 @@ def ballot_gen(str_tk, str_h, bitmask, permutation, ballot_serial_number, part_t
                 continue
 
             # r_{i,j} = \Sum hmac_sk{ballot_serial_number, part_tag, question_index, b"rand", p, ctr}
-            bn_r = Bn(0)
-            for k in tk:
-                h = Hmac(b"sha256", k)
-                h.update(b",".join(
-                    force_bytes(v) for v in [ballot_serial_number, part_tag, question_index, b"rand", p, ctr]))
-                bn_temp = Bn.from_binary(h.digest())
-                bn_r = bn_r.mod_add(bn_temp, order)
+            # delta 1 - 6 = \Sum hmac_sk{ballot_serial_number, part_tag, question_index, b"zk", p, ctr, m}
+            bn_temp = election_ctx.hmac_sum([msg(b"rand", p, ctr)] + [msg(b"zk", p, ctr, m) for m in range(6)])
+            bn_r = bn_temp[0]
+            bn_delta = bn_temp[1:]
             row_r.append(bn_r)
 
             # zk
@@ -87,24 +218,13 @@ def ballot_gen(str_tk, str_h, bitmask, permutation, ballot_serial_number, part_t
             bn_s = order.random()
             bn_y = order.random()
             # T = Enc(t,s) Y = Enc((1-b)t,y)
-            ec_T1 = bn_s * ec_g
-            ec_T2 = bn_t * ec_g + bn_s * ec_h
-            ec_Y1 = bn_y * ec_g
-            ec_Y2 = bn_y * ec_h
+            ec_T1 = fb.g(bn_s)
+            ec_T2 = fb.gh(bn_t, bn_s)
+            ec_Y1 = fb.g(bn_y)
             if i + 1 != bitmask[j]:  # b_i,j = 0
-                ec_Y2 += bn_t * ec_g
-
-            # compute delta 1 - 6
-            bn_delta = []
-            for m in range(6):
-                bn_delta.append(Bn(0))
-            for k in tk:
-                for m in range(6):
-                    h = Hmac(b"sha256", k)
-                    h.update(b",".join(
-                        force_bytes(v) for v in [ballot_serial_number, part_tag, question_index, b"zk", p, ctr, m]))
-                    bn_temp = Bn.from_binary(h.digest())
-                    bn_delta[m] = bn_delta[m].mod_add(bn_temp, order)
+                ec_Y2 = fb.gh(bn_t, bn_y)
+            else:
+                ec_Y2 = fb.h(bn_y)
 
             # compute phi
             phi1 = bn_delta[0]
@@ -116,22 +236,22 @@ def ballot_gen(str_tk, str_h, bitmask, permutation, ballot_serial_number, part_t
             phi6 = bn_delta[5].mod_sub(bn_temp, order)
 
             # encrypt b=1 if j = i, otherwise encrypt b=0
-            ec_c1 = bn_r * ec_g
-            ec_c2 = bn_r * ec_h
+            ec_c1 = fb.g(bn_r)
+            ec_c2 = fb.h(bn_r)
             if i + 1 == bitmask[j]:  # fix c2, phi1 and phi5 if b = 1
                 ec_c2 += ec_g
                 phi1 = phi1.mod_add(Bn(1), order)
                 phi5 = phi5.mod_sub(bn_r, order)
 
             row_commitment.append({
-                'C1': b64encode(ec_c1.export()),
-                'C2': b64encode(ec_c2.export()),
+                'C1': b64encode(ec_c1.export(POINT_FORMAT)),
+                'C2': b64encode(ec_c2.export(POINT_FORMAT)),
             })
             row_zk.append({
-                'T1': b64encode(ec_T1.export()),
-                'T2': b64encode(ec_T2.export()),
-                'Y1': b64encode(ec_Y1.export()),
-                'Y2': b64encode(ec_Y2.export()),
+                'T1': b64encode(ec_T1.export(POINT_FORMAT)),
+                'T2': b64encode(ec_T2.export(POINT_FORMAT)),
+                'Y1': b64encode(ec_Y1.export(POINT_FORMAT)),
+                'Y2': b64encode(ec_Y2.export(POINT_FORMAT)),
                 'phi1': b64encode(phi1.binary()),
                 'phi2': b64encode(phi2.binary()),
                 'phi3': b64encode(phi3.binary()),
@@ -146,10 +266,10 @@ def ballot_gen(str_tk, str_h, bitmask, permutation, ballot_serial_number, part_t
         bn_v = order.random()
         bn_z = order.random()
         # U = Enc(u,v) Z = Enc((1-\sum b_i)u,z)
-        ec_U1 = bn_v * ec_g
-        ec_U2 = bn_u * ec_g + bn_v * ec_h
-        ec_Z1 = bn_z * ec_g
-        ec_Z2 = bn_z * ec_h
+        ec_U1 = fb.g(bn_v)
+        ec_U2 = fb.gh(bn_u, bn_v)
+        ec_Z1 = fb.g(bn_z)
+        ec_Z2 = fb.h(bn_z)
 
         # compute \sum r_i for each row
         bn_row_r = Bn(0)
@@ -157,16 +277,7 @@ def ballot_gen(str_tk, str_h, bitmask, permutation, ballot_serial_number, part_t
             bn_row_r = bn_row_r.mod_add(r, order)
 
         # delta 7 - 12
-        bn_delta_row = []
-        for m in range(6):
-            bn_delta_row.append(Bn(0))
-        for k in tk:
-            for m in range(6):
-                h = Hmac(b"sha256", k)
-                h.update(b",".join(
-                    force_bytes(v) for v in [ballot_serial_number, part_tag, question_index, b"zk_row", p, m]))
-                bn_temp = Bn.from_binary(h.digest())
-                bn_delta_row[m] = bn_delta_row[m].mod_add(bn_temp, order)
+        bn_delta_row = election_ctx.hmac_sum([msg(b"zk_row", p, m) for m in range(6)])
 
         # phi 7 - 12
         phi7 = bn_delta_row[0]
@@ -178,15 +289,15 @@ def ballot_gen(str_tk, str_h, bitmask, permutation, ballot_serial_number, part_t
         phi12 = bn_delta_row[5].mod_sub(bn_temp, order)
 
         if bitmask[i] == 0:  # \sum b_i = 0, fake ballots
-            ec_Z2 += bn_u * ec_g
+            ec_Z2 += fb.g(bn_u)
             phi7 = phi7.mod_add(Bn(1), order)
             phi11 = phi11.mod_sub(bn_row_r, order)
 
         row_zk.append({
-            'U1': b64encode(ec_U1.export()),
-            'U2': b64encode(ec_U2.export()),
-            'Z1': b64encode(ec_Z1.export()),
-            'Z2': b64encode(ec_Z2.export()),
+            'U1': b64encode(ec_U1.export(POINT_FORMAT)),
+            'U2': b64encode(ec_U2.export(POINT_FORMAT)),
+            'Z1': b64encode(ec_Z1.export(POINT_FORMAT)),
+            'Z2': b64encode(ec_Z2.export(POINT_FORMAT)),
             'phi7': b64encode(phi7.binary()),
             'phi8': b64encode(phi8.binary()),
             'phi9': b64encode(phi9.binary()),
@@ -198,33 +309,25 @@ def ballot_gen(str_tk, str_h, bitmask, permutation, ballot_serial_number, part_t
         rows.append((row_commitment, row_zk))
         rand.append(row_r)
 
-    # column ZK
+    # column ZK, delta 13, 14 of all columns
+    bn_delta_cols = election_ctx.hmac_sum([msg(b"zk_col", ia, m) for ia in range(total) for m in range(2)])
     for ia in range(total):
-        bn_delta_col = []  # delta13, 14
+        bn_delta_col = bn_delta_cols[2 * ia: 2 * ia + 2]  # delta13, 14
         bn_col_r = Bn(0)
-        for m in range(2):
-            bn_delta_col.append(Bn(0))
-        for k in tk:
-            for m in range(2):
-                h = Hmac(b"sha256", k)
-                h.update(b",".join(
-                    force_bytes(v) for v in [ballot_serial_number, part_tag, question_index, b"zk_col", ia, m]))
-                bn_temp = Bn.from_binary(h.digest())
-                bn_delta_col[m] = bn_delta_col[m].mod_add(bn_temp, order)
 
         # compute sum of column r
         for ib in range(n):
             bn_col_r = bn_col_r.mod_add(rand[ib][ia], order)
 
         bn_w = order.random()
-        ec_W1 = bn_w * ec_g
-        ec_W2 = bn_w * ec_h
+        ec_W1 = fb.g(bn_w)
+        ec_W2 = fb.h(bn_w)
         phi13 = bn_delta_col[0].mod_add(bn_col_r, order)
         phi14 = bn_delta_col[1].mod_add(bn_w, order)
 
         zk.append({
-            'W1': b64encode(ec_W1.export()),
-            'W2': b64encode(ec_W2.export()),
+            'W1': b64encode(ec_W1.export(POINT_FORMAT)),
+            'W2': b64encode(ec_W2.export(POINT_FORMAT)),
             'phi13': b64encode(phi13.binary()),
             'phi14': b64encode(phi14.binary()),
         })
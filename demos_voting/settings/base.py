@@ -204,11 +204,61 @@ DEMOS_VOTING_INTERNAL_URLS = None
 
 DEMOS_VOTING_API_VERIFY = True
 
+# DEMOS_VOTING_API_POOL_SIZE: The maximum number of connections that are kept
+# alive per server for internal API requests, in each thread. It defaults to
+# 10.
+
+DEMOS_VOTING_API_POOL_SIZE = None
+
+# DEMOS_VOTING_API_RETRIES: The maximum number of retries for internal API
+# requests that failed to connect. Other failures are not retried, a retry would
+# re-use the request's nonce. It defaults to 3.
+
+DEMOS_VOTING_API_RETRIES = 3
+
+# DEMOS_VOTING_API_KEY_CACHE_TIMEOUT: The number of seconds that the internal
+# API requests' signature keys are cached for, in each process. It defaults to
+# 60.
+
+DEMOS_VOTING_API_KEY_CACHE_TIMEOUT = 60
+
+# DEMOS_VOTING_NONCE_STORE: Where the nonces of the internal API requests are
+# recorded. `BACKEND` is one of 'DatabaseNonceStore' (the default),
+# 'RedisNonceStore' (`OPTIONS`: `url`, e.g. the Celery broker's URL) or
+# 'LocalNonceStore' (for development and testing only), all in the module
+# 'demos_voting.base.utils.http_signatures'.
+
+DEMOS_VOTING_NONCE_STORE = {
+    'BACKEND': 'demos_voting.base.utils.http_signatures.DatabaseNonceStore',
+    'OPTIONS': {},
+}
+
 # DEMOS_VOTING_TASK_CONCURRENCY: The number of concurrent tasks that will be
 # used. It defaults to the number of CPUs in the system.
 
 DEMOS_VOTING_TASK_CONCURRENCY = None
 
+# DEMOS_VOTING_CRYPTO_WORKERS: (election-authority) The number of worker
+# processes that each ballot generation task uses for the ballots' crypto, so
+# that it overlaps with sending the ballots to the other servers. If it is not
+# set then the crypto is generated in the task's process.
+
+DEMOS_VOTING_CRYPTO_WORKERS = None
+
+# DEMOS_VOTING_COINS_FORMAT: (bulletin-board) The format of the voters' coins
+# that is hashed to generate the election's coins. It is either 'digits' (one
+# ASCII digit per ballot, the original format) or 'bits' (the packed coin
+# vector). It defaults to 'digits'.
+
+DEMOS_VOTING_COINS_FORMAT = None
+
+# DEMOS_VOTING_VERIFY_TALLY_COMMITMENT: (bulletin-board) Recompute the tally
+# commitment from the voted options' commitments (in parallel tasks) and verify
+# that it is equal to the running tally commitment that was kept during the
+# voting phase. It defaults to False.
+
+DEMOS_VOTING_VERIFY_TALLY_COMMITMENT = False
+
 # DEMOS_VOTING_MAX_*: (election-authority) The maximum number of ballots,
 # trustees, questions, options per question, parties, candidates per party.
 # If these values are changed then the value of `DATA_UPLOAD_MAX_MEMORY_SIZE`
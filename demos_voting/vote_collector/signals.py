@@ -25,7 +25,7 @@ def start_voting_phase(election, **kwargs):
 def end_voting_phase(election, **kwargs):
     try:
         # Notify the Bulletin Board that the voting phase has ended.
-        with BulletinBoardAPISession() as s:
+        with BulletinBoardAPISession.borrow() as s:
             serializer = ElectionSerializer(instance=election, fields=['state'])
             r = s.patch('elections/%s/' % election.slug, json=serializer.data)
             r.raise_for_status()
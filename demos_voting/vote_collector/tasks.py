@@ -9,7 +9,7 @@ from django.conf import settings
 from django.db import transaction
 from django.utils import timezone
 
-from demos_voting.base.utils import get_range_in_chunks
+from demos_voting.base.utils import get_key_range_in_chunks
 from demos_voting.vote_collector.models import Ballot, Election
 from demos_voting.vote_collector.serializers import BulletinBoardBallotSerializer, ElectionSerializer
 from demos_voting.vote_collector.utils.api import BulletinBoardAPISession
@@ -42,7 +42,7 @@ def extend_voting_period(election_pk):
         return
     assert election.state == election.STATE_VOTING
     # Notify the Bulletin Board that the voting phase has been extended.
-    with BulletinBoardAPISession() as s:
+    with BulletinBoardAPISession.borrow() as s:
         serializer = ElectionSerializer(instance=election, fields=['voting_ends_at'])
         r = s.patch('elections/%s/' % election.slug, json=serializer.data)
         r.raise_for_status()
@@ -71,29 +71,34 @@ def prepare_publish_cast_ballots(self, election_pk):
         # Do the locking in a subquery to avoid fetching any results.
         Ballot.objects.filter(pk__in=election.ballots.select_for_update()).exists()
     # Start the publish cast ballots tasks.
-    ballot_count = election.ballots.filter(parts__is_cast=True).distinct().count()
+    ballots = election.ballots.filter(parts__is_cast=True)
+    serial_number_ranges = get_key_range_in_chunks(ballots, TASK_CONCURRENCY, 'serial_number')
     publish_cast_ballots_tasks = [
-        publish_cast_ballots.si(election_pk, range_start, range_stop)
-        for range_start, range_stop in get_range_in_chunks(ballot_count, TASK_CONCURRENCY)
+        publish_cast_ballots.si(election_pk, serial_number_start, serial_number_stop)
+        for serial_number_start, serial_number_stop in serial_number_ranges
     ]
     finalize_voting_phase_task = finalize_voting_phase.si(election_pk=election_pk)
     chord(publish_cast_ballots_tasks, finalize_voting_phase_task).delay()
 
 
 @shared_task
-def publish_cast_ballots(election_pk, range_start, range_stop):
+def publish_cast_ballots(election_pk, serial_number_start, serial_number_stop):
     """
-    Select the ballots that have been cast from the specified range and send
-    them to the Bulletin Board.
+    Select the ballots that have been cast from the specified serial number
+    range (stop is exclusive) and send them to the Bulletin Board.
     """
     election = Election.objects.get(pk=election_pk)
     if election.state in (election.STATE_FAILED, election.STATE_CANCELLED):
         return
     assert election.state == election.STATE_VOTING
     # Send the cast ballot objects to the Bulletin Board.
-    ballots = election.ballots.filter(parts__is_cast=True).distinct()
-    with BulletinBoardAPISession() as s:
-        for ballot in ballots[range_start: range_stop].iterator():
+    ballots = election.ballots.filter(
+        serial_number__gte=serial_number_start,
+        serial_number__lt=serial_number_stop,
+        parts__is_cast=True,
+    )
+    with BulletinBoardAPISession.borrow() as s:
+        for ballot in ballots.distinct().iterator():
             serializer = BulletinBoardBallotSerializer(ballot, context={'election': election})
             r = s.patch('elections/%s/ballots/%d/' % (election.slug, ballot.serial_number), json=serializer.data)
             r.raise_for_status()
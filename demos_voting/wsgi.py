@@ -16,3 +16,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "demos_voting.settings")
 
 application = get_wsgi_application()
+
+# Verify the API requests' body digests while the bodies are being read. This
+# must be imported after the application has been set up.
+from demos_voting.base.authentication import DigestVerifyingWSGIMiddleware  # noqa: E402
+
+application = DigestVerifyingWSGIMiddleware(application)